@@ -0,0 +1,191 @@
+"""
+Local stand-in for the finnhub and news api servers, serving deterministic synthetic data with a configurable
+latency and rate limit
+
+Run from the project root:
+python -m benchmarks.mock_server --port 8765 --latency 0.05 --rate 30
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import argparse
+import threading
+import datetime
+import hashlib
+import random
+import json
+import time
+import logging as log
+
+HEADLINE_WORDS = ["surges", "falls", "beats expectations", "misses estimates", "rallies", "slumps", "is upgraded",
+                  "is downgraded", "announces buyback", "faces probe", "reports record sales", "cuts guidance"]
+SOURCES = ["Reuters", "Bloomberg", "MarketWatch", "CNBC", "Yahoo"]
+INDUSTRIES = ["Technology", "Banking", "Retail", "Energy", "Pharmaceuticals", "Media"]
+WIRE_STORIES = [
+  "Federal Reserve holds interest rates steady as inflation cools, officials signal patience on further cuts",
+  "Oil prices jump after supply disruption in the Middle East lifts energy shares across global markets",
+  "Treasury yields climb as strong jobs report tempers hopes for rate cuts later this year",
+  "Stocks rally to record highs led by technology shares as investors shrug off tariff worries",
+  "Dollar slides against major currencies after weaker than expected retail sales figures",
+  "Chipmakers slump after new export restrictions on advanced semiconductors to China",
+  "Bank shares fall as regulators propose tougher capital requirements for large lenders",
+  "Consumer confidence rebounds in October as gasoline prices ease and wages rise"
+]
+
+
+def __rng(*parts) -> random.Random:
+  # the same request always returns the same data
+  return random.Random(int.from_bytes(hashlib.md5("/".join(parts).encode()).digest()[:8], "big"))
+
+
+def company_news(symbol: str, articles: int, wire=0.0) -> list:
+  rnd = __rng("news", symbol)
+  day = datetime.datetime.combine(datetime.date.today() - datetime.timedelta(days=1), datetime.time())
+  news = []
+  for i in range(rnd.randint(articles // 2, articles)):
+    if rnd.random() < wire:
+      # market wide wire stories are published for many symbols, with the odd word changed
+      story = rnd.randrange(len(WIRE_STORIES))
+      words = WIRE_STORIES[story].split()
+      words[rnd.randrange(len(words))] = rnd.choice(["today", "again", "sharply"])
+      news.append({
+        "category": "company news", "datetime": int(day.timestamp()) + 3600 * story + rnd.randint(0, 600),
+        "headline": " ".join(words[:8]), "id": rnd.randint(1, 10 ** 9), "image": "https://img.example.com/wire/%d.jpg" % story,
+        "related": symbol, "source": rnd.choice(SOURCES), "summary": " ".join(words) + ".",
+        "url": "https://news.example.com/wire/%d/%s" % (story, symbol)
+      })
+      continue
+    headline = "%s %s" % (symbol, rnd.choice(HEADLINE_WORDS))
+    news.append({
+      "category": "company news", "datetime": int(day.timestamp()) + rnd.randint(0, 86399),
+      "headline": headline, "id": rnd.randint(1, 10 ** 9), "image": "https://img.example.com/%s/%d.jpg" % (symbol, i),
+      "related": symbol, "source": rnd.choice(SOURCES),
+      "summary": "%s. Analysts said the move was %s." % (headline, rnd.choice(["good", "bad", "surprising", "expected", "great", "terrible"])),
+      "url": "https://news.example.com/%s/%d" % (symbol, i)
+    })
+  return news
+
+
+def company_profile(symbol: str) -> dict:
+  rnd = __rng("profile", symbol)
+  return {"name": symbol.title() + " Inc", "ticker": symbol, "finnhubIndustry": rnd.choice(INDUSTRIES),
+          "country": "US", "currency": "USD", "exchange": "NASDAQ"}
+
+
+def stock_quote(symbol: str) -> dict:
+  rnd = __rng("quote", symbol)
+  o = round(rnd.uniform(5, 500), 2)
+  c = round(o * rnd.uniform(0.95, 1.05), 2)
+  return {"o": o, "c": c, "h": round(max(o, c) * 1.01, 2), "l": round(min(o, c) * 0.99, 2), "pc": o, "t": int(time.time())}
+
+
+def top_headlines(query: str) -> dict:
+  rnd = __rng("headlines", query)
+  articles = [{"title": "%s sector %s" % (query, rnd.choice(HEADLINE_WORDS)), "url": "https://news.example.com/%s/%d" % (query, i),
+               "source": {"name": rnd.choice(SOURCES)}} for i in range(20)]
+  return {"status": "ok", "totalResults": len(articles), "articles": articles}
+
+
+class RateLimit:
+  """
+  Fixed window limit of `rate` requests per second, answered with 429 and a Retry-After header once exceeded
+  """
+
+  def __init__(self, rate: float):
+    self.rate = rate
+    self.window = int(time.time())
+    self.count = 0
+    self.lock = threading.Lock()
+
+  def allow(self) -> bool:
+    if self.rate <= 0:
+      return True
+    with self.lock:
+      now = int(time.time())
+      if now != self.window:
+        self.window = now
+        self.count = 0
+      self.count += 1
+      return self.count <= self.rate
+
+
+class MockHandler(BaseHTTPRequestHandler):
+  protocol_version = "HTTP/1.1"
+
+  def log_message(self, format, *args):
+    log.debug("mock server: " + format, *args)
+
+  def __reply(self, status, body, headers=None):
+    data = json.dumps(body).encode()
+    self.send_response(status)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(data)))
+    for k, v in (headers or {}).items():
+      self.send_header(k, v)
+    self.end_headers()
+    self.wfile.write(data)
+
+  def do_GET(self):
+    server = self.server
+    with server.lock:
+      server.requests += 1
+    if server.latency > 0:
+      time.sleep(server.latency)
+    if not server.limit.allow():
+      with server.lock:
+        server.throttled += 1
+      return self.__reply(429, {"error": "API limit reached"}, {"Retry-After": "1"})
+    url = urlparse(self.path)
+    params = {k: v[0] for k, v in parse_qs(url.query).items()}
+    path = url.path
+    symbol = params.get("symbol", "").upper()
+    if path.endswith("/company-news"):
+      return self.__reply(200, company_news(symbol, server.articles, server.wire))
+    if path.endswith("/stock/profile2"):
+      return self.__reply(200, company_profile(symbol))
+    if path.endswith("/quote"):
+      return self.__reply(200, stock_quote(symbol))
+    if path.endswith("/top-headlines"):
+      return self.__reply(200, top_headlines(params.get("category") or params.get("q", "")))
+    return self.__reply(404, {"error": "Unknown endpoint " + path})
+
+
+class MockServer(ThreadingHTTPServer):
+  daemon_threads = True
+
+  def __init__(self, port=0, latency=0.0, rate=0.0, articles=10, wire=0.0):
+    super().__init__(("127.0.0.1", port), MockHandler)
+    self.latency = latency
+    self.limit = RateLimit(rate)
+    self.articles = articles
+    self.wire = wire
+    self.requests = 0
+    self.throttled = 0
+    self.lock = threading.Lock()
+
+  @property
+  def url(self) -> str:
+    return "http://127.0.0.1:%d" % self.server_address[1]
+
+  def start(self) -> "MockServer":
+    threading.Thread(target=self.serve_forever, daemon=True).start()
+    log.info("Mock api server listening on %s with %.3fs latency and %s requests/second",
+             self.url, self.latency, str(self.limit.rate or "unlimited"))
+    return self
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Serve synthetic finnhub and news api responses locally")
+  parser.add_argument('--port', type=int, default=8765, help='port to listen on. default is 8765')
+  parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every response. default is 0.05')
+  parser.add_argument('--rate', type=float, default=0, help='requests per second before answering 429. default is unlimited')
+  parser.add_argument('--articles', type=int, default=10, help='maximum news articles per symbol. default is 10')
+  parser.add_argument('--wire', type=float, default=0, help='share of articles that are market wide wire stories. default is 0')
+  args = parser.parse_args()
+  log.basicConfig(format='%(asctime)s - [%(levelname)s] %(message)s', level=log.INFO)
+  server = MockServer(args.port, args.latency, args.rate, args.articles, args.wire)
+  log.info("Serving on %s. Point FINNHUB_URL and NEWS_URL at it", server.url)
+  server.serve_forever()
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,213 @@
+"""
+End to end benchmark of stock_info_runner against local stand-ins of every external service:
+the mock finnhub and news api server, synthetic price files instead of yfinance, local chart storage instead of GCS
+and the fake gmail service. Stage timings are read from the run metrics and appended to a results file so every
+run is compared with the previous run of the same parameters
+
+Run from the project root:
+python -m benchmarks.pipeline_run --symbols 1000 --clients 1000 --latency 0.05 --rate 30
+"""
+import argparse
+import subprocess
+import datetime
+import tempfile
+import random
+import shutil
+import json
+import time
+import sys
+import os
+import logging as log
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from benchmarks.mock_server import MockServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_PATH = os.path.join(ROOT, ".cache", "benchmarks", "results.jsonl")
+
+log.basicConfig(format='%(asctime)s - [%(levelname)s] %(message)s', level=log.INFO)
+
+
+def __write_prices(directory, symbols, days, seed) -> None:
+  os.makedirs(directory, exist_ok=True)
+  rnd = np.random.default_rng(seed)
+  dates = pd.bdate_range(end=datetime.date.today() - datetime.timedelta(days=1), periods=days, name="Date")
+  for symbol in symbols:
+    close = rnd.uniform(10, 500) * np.exp(np.cumsum(rnd.normal(0, 0.02, days)))
+    spread = close * rnd.uniform(0.001, 0.02, days)
+    df = pd.DataFrame({"Open": close + rnd.uniform(-1, 1, days) * spread, "High": close + spread,
+                       "Low": close - spread, "Close": close}, index=dates)
+    df.to_csv(os.path.join(directory, symbol + ".csv"))
+
+
+def __write_config(path, symbols, n_clients, per_client, seed) -> None:
+  rnd = random.Random(seed)
+  mappings = [{"email": "client%d@example.com" % i, "stocks": rnd.sample(symbols, min(per_client, len(symbols)))}
+              for i in range(n_clients)]
+  with open(path, 'w') as f:
+    yaml.safe_dump({"sender": "benchmark@example.com", "mappings": mappings}, f)
+
+
+def __environment(workdir, server, args) -> dict:
+  unlimited = "1000000"
+  env = dict(os.environ)
+  env.update({
+    "FINNHUB_URL": server.url, "NEWS_URL": server.url, "FINNHUB_API_KEY": "benchmark", "NEWS_API_KEY": "benchmark",
+    "FINNHUB_RATE_PER_SECOND": str(args.rate) if args.rate > 0 else unlimited, "FINNHUB_RATE_PER_MINUTE": unlimited,
+    "CACHE_PATH": os.path.join(workdir, "cache", "responses.sqlite"),
+    "PRICE_DATA_DIR": os.path.join(workdir, "prices"),
+    "STORAGE_BACKEND": "local", "GCP_BUCKET": "benchmark",
+    "GMAIL_BACKEND": "fake", "GMAIL_FAKE_LATENCY": str(args.latency), "GMAIL_RATE_PER_SECOND": unlimited,
+    "GMAIL_RATE_PER_MINUTE": unlimited,
+    "METRICS_DIR": os.path.join(workdir, "metrics"),
+    "JOURNAL_DIR": os.path.join(workdir, "journal"),
+    "SHARD_DIR": os.path.join(workdir, "shards")
+  })
+  return env
+
+
+def __summarize(metrics) -> dict:
+  summary = {"stages": {}, "requests": {}, "latency": {}}
+  for m in metrics["gauges"]:
+    if m["name"] == "stage_seconds":
+      summary["stages"][m["labels"]["stage"]] = round(m["value"], 4)
+    elif m["name"] == "emails_per_second":
+      summary["emails_per_second"] = round(m["value"], 2)
+  for m in metrics["counters"]:
+    if m["name"] == "api_requests_total":
+      key = m["labels"]["provider"] + ":" + m["labels"]["status"]
+      summary["requests"][key] = summary["requests"].get(key, 0) + m["value"]
+    elif m["name"] == "emails_sent_total":
+      summary["emails_sent"] = m["value"]
+  for m in metrics["histograms"]:
+    if m["value"]["count"]:
+      label = ",".join(str(v) for v in m["labels"].values())
+      summary["latency"][m["name"] + ":" + label] = round(m["value"]["sum"] / m["value"]["count"], 6)
+  return summary
+
+
+def __previous(results_path, params):
+  if not os.path.exists(results_path):
+    return None
+  previous = None
+  with open(results_path, 'r') as f:
+    for line in f:
+      result = json.loads(line)
+      if result["params"] == params:
+        previous = result
+  return previous
+
+
+def __compare(previous, result, threshold) -> list:
+  """
+  Logs the change of every stage since the previous result and returns the stages that slowed down by more than the threshold
+  """
+  regressions = []
+  rows = [("wall", previous["wall_seconds"], result["wall_seconds"])]
+  rows += [(s, previous["stages"].get(s), t) for s, t in sorted(result["stages"].items())]
+  log.info("Compared with %s (%s):", previous["timestamp"], previous.get("commit") or "unknown commit")
+  for stage, before, after in rows:
+    if not before:
+      log.info("  %-16s %10s -> %9.3fs", stage, "new", after)
+      continue
+    change = (after - before) / before
+    log.info("  %-16s %9.3fs -> %9.3fs  %+7.1f%%", stage, before, after, 100 * change)
+    # stages shorter than 10ms are too noisy to compare
+    if change > threshold and after - before > 0.01:
+      regressions.append(stage)
+  return regressions
+
+
+def __commit() -> str:
+  try:
+    return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+  except OSError:
+    return None
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark stock_info_runner end to end against local stand-in services")
+  parser.add_argument('--symbols', type=int, default=100, help='number of unique stock symbols. default is 100')
+  parser.add_argument('--clients', type=int, default=100, help='number of clients. default is 100')
+  parser.add_argument('--per-client', type=int, default=5, help='stocks per client. default is 5')
+  parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every mock api response. default is 0.05')
+  parser.add_argument('--rate', type=float, default=0, help='mock api requests per second before answering 429. default is unlimited')
+  parser.add_argument('--articles', type=int, default=10, help='maximum news articles per symbol. default is 10')
+  parser.add_argument('--wire', type=float, default=0, help='share of articles that are market wide wire stories. default is 0')
+  parser.add_argument('--charts', choices=['png', 'svg'], default='svg', help='chart mode of the run. default is svg')
+  parser.add_argument('--sentiment', choices=['textblob', 'fast'], default='fast', help='sentiment backend. default is fast')
+  parser.add_argument('--runner-args', default='', help='extra stock_info_runner arguments, e.g. "--shards 4"')
+  parser.add_argument('--runs', type=int, default=1,
+    help='runs of stock_info_runner in the same working directory, the last is measured, e.g. 2 for a warm --delta run. default is 1')
+  parser.add_argument('--seed', type=int, default=0, help='random seed. default is 0')
+  parser.add_argument('--label', default='', help='label stored with the result')
+  parser.add_argument('--results', default=RESULTS_PATH, help='results file. default is ' + RESULTS_PATH)
+  parser.add_argument('--threshold', type=float, default=0.1, help='relative slow down reported as a regression. default is 0.1')
+  parser.add_argument('--fail-on-regression', action='store_true', help='exit with status 1 when a stage regressed')
+  parser.add_argument('--keep', action='store_true', help='keep the working directory')
+  args = parser.parse_args()
+
+  workdir = tempfile.mkdtemp(prefix="stock-info-benchmark-")
+  symbols = ["SYM%d" % i for i in range(args.symbols)]
+  log.info("Generating %d symbols and %d clients in %s", args.symbols, args.clients, workdir)
+  __write_prices(os.path.join(workdir, "prices"), symbols, 130, args.seed)
+  config = os.path.join(workdir, "config.yaml")
+  __write_config(config, symbols, args.clients, args.per_client, args.seed)
+
+  server = MockServer(0, args.latency, args.rate, args.articles, args.wire).start()
+  cmd = [sys.executable, os.path.join(ROOT, "stock_info_runner.py"), config, "--charts", args.charts,
+         "--sentiment", args.sentiment, "--loglevel", "WARN"] + args.runner_args.split()
+  metrics_dir = os.path.join(workdir, "metrics")
+  for run in range(args.runs):
+    # only the metrics of the measured run are summarized
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    server.requests = server.throttled = 0
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=ROOT, env=__environment(workdir, server, args))
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+      server.shutdown()
+      log.error("stock_info_runner exited with status %d in run %d. Working directory kept at %s", proc.returncode,
+                run + 1, workdir)
+      raise SystemExit(proc.returncode)
+  server.shutdown()
+
+  # the stock shards of a sharded benchmark write their own metrics, the runner's own metrics have no stage suffix
+  name = [f for f in os.listdir(metrics_dir) if f.endswith(".json") and "-sections" not in f][0]
+  with open(os.path.join(metrics_dir, name), 'r') as f:
+    summary = __summarize(json.load(f))
+
+  params = {k: getattr(args, k) for k in ("symbols", "clients", "per_client", "latency", "rate", "articles", "charts",
+                                          "sentiment", "runner_args", "seed")}
+  # results of runs from before wire stories and repeated runs existed stay comparable
+  if args.wire:
+    params["wire"] = args.wire
+  if args.runs > 1:
+    params["runs"] = args.runs
+  result = dict(timestamp=datetime.datetime.now().isoformat(timespec="seconds"), commit=__commit(), label=args.label,
+                params=params, wall_seconds=round(wall, 3), mock_requests=server.requests, mock_throttled=server.throttled,
+                **summary)
+  log.info("Finished in %.3fs with %d mock api requests, %d throttled", wall, server.requests, server.throttled)
+  for stage, seconds in sorted(summary["stages"].items(), key=lambda s: -s[1]):
+    log.info("  %-16s %9.3fs", stage, seconds)
+
+  previous = __previous(args.results, params)
+  regressions = __compare(previous, result, args.threshold) if previous is not None else []
+  os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+  with open(args.results, 'a') as f:
+    f.write(json.dumps(result) + "\n")
+  log.info("Appended result to %s", args.results)
+
+  if not args.keep:
+    shutil.rmtree(workdir)
+  if regressions:
+    log.warning("Stages slower by more than %d%%: %s", int(args.threshold * 100), ", ".join(regressions))
+    if args.fail_on_regression:
+      raise SystemExit(1)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,81 @@
+"""
+Benchmark of per-report render time for synthetic clients
+
+Run from the project root:
+python -m benchmarks.report_render --clients 10000
+"""
+import argparse
+import random
+import tempfile
+import time
+import os
+import logging as log
+
+from src import settings
+from src.html import report_maker
+from src.records import Profile, NewsArticle, QuoteTable
+
+log.basicConfig(format='%(asctime)s - [%(levelname)s] %(message)s', level=log.INFO)
+
+
+def __synthetic_data(n_stocks, seed):
+  rnd = random.Random(seed)
+  stocks = ["SYM%d" % i for i in range(n_stocks)]
+  profiles = {s: Profile("Company " + s, "Technology") for s in stocks}
+  quotes = QuoteTable(stocks)
+  for s in stocks:
+    quotes.set(s, {"o": round(rnd.uniform(10, 500), 2), "c": round(rnd.uniform(10, 500), 2),
+                   "h": round(rnd.uniform(10, 500), 2), "l": round(rnd.uniform(10, 500), 2)})
+  sentiment_scores = {s: round(rnd.uniform(-1, 1), 2) for s in stocks}
+  news = {}
+  for s in stocks:
+    news[s] = [NewsArticle(
+      headline="%s headline number %d moves the market" % (s, i), summary="",
+      url="https://news.example.com/%s/%d" % (s, i),
+      image="https://img.example.com/%s/%d.jpg" % (s, i),
+      source="Example News",
+      datetime=1600000000 + rnd.randint(0, 86400 * 365)
+    ) for i in range(rnd.randint(0, 12))]
+  charts = {s: ["<svg></svg>"] * 3 for s in stocks}
+  return stocks, profiles, quotes, sentiment_scores, news, charts
+
+
+def __percentile(values, p):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark per-report render time across synthetic clients")
+  parser.add_argument('--clients', type=int, default=10000, help='number of clients. default is 10000')
+  parser.add_argument('--stocks', type=int, default=800, help='number of unique stocks. default is 800')
+  parser.add_argument('--per-client', type=int, default=5, help='stocks per client. default is 5')
+  parser.add_argument('--seed', type=int, default=0, help='random seed. default is 0')
+  args = parser.parse_args()
+
+  if settings.GCP_BUCKET is None:
+    settings.GCP_BUCKET = "benchmark"
+  stocks, profiles, quotes, sentiment_scores, news, charts = __synthetic_data(args.stocks, args.seed)
+  rnd = random.Random(args.seed)
+  clients = {"client%d@example.com" % i: rnd.sample(stocks, min(args.per_client, len(stocks))) for i in range(args.clients)}
+
+  with tempfile.TemporaryDirectory() as output_dir:
+    os.mkdir(os.path.join(output_dir, "reports"))
+    start = time.perf_counter()
+    sections = report_maker.render_sections(stocks, profiles, news, quotes, sentiment_scores, charts)
+    sections_time = time.perf_counter() - start
+
+    times = []
+    for client in clients:
+      start = time.perf_counter()
+      report_maker.write_report(clients[client], output_dir, client, sections)
+      times.append(time.perf_counter() - start)
+
+  log.info("Rendered %d stock sections in %.3fs", len(sections), sections_time)
+  log.info("Rendered %d reports in %.3fs: mean %.1fus, p50 %.1fus, p95 %.1fus, max %.1fus per report",
+           len(times), sum(times), 1e6 * sum(times) / len(times), 1e6 * __percentile(times, 0.5),
+           1e6 * __percentile(times, 0.95), 1e6 * max(times))
+
+
+if __name__ == "__main__":
+  main()
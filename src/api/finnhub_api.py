@@ -1,10 +1,14 @@
 from .. import settings
-import requests
+from . import rate_limiter
+from . import response_cache
+from . import price_store
+from .. import records
+from . import json_stream
 import datetime
 from datetime import timezone
 import logging as log
 
-FINNHUB_URL = "https://finnhub.io/api/v1"
+FINNHUB_URL = settings.FINNHUB_URL
 
 
 def __validate_date(date):
@@ -13,16 +17,31 @@ def __validate_date(date):
     except ValueError:
       raise ValueError("Incorrect date format, should be YYYY-MM-DD")
 
-def __submit_request(url):
+def __submit_request(url, stream=False):
   url += ("&token=" + settings.FINNHUB_KEY)
-  r = requests.get(url)
-  if r.status_code == 200:
-    return r
-  log.error("Request %s failed with status %s and message %s", url, str(r.status_code), r.text)
+  return rate_limiter.submit_request("finnhub", url, stream)
+
+
+def __get_json(url, endpoint, default, project=None):
+  """
+  Returns the json body of a request, served from the response cache when a fresh copy exists.
+  project optionally reduces a fresh response to the fields that are used before it is cached
+  """
+  data = response_cache.get(endpoint, url)
+  if data is not None:
+    return data
+  r = __submit_request(url)
+  if r is None:
+    return default
+  data = r.json()
+  if project is not None:
+    data = project(data)
+  response_cache.put(endpoint, url, data)
+  return data
 
 def get_company_news(symbol:str, start_date:str, end_date:str):
   """ 
-  Returns company news.
+  Returns company news as a list of records.NewsArticle
   
   Parameters:
   symbol: stock symbol as str
@@ -34,8 +53,38 @@ def get_company_news(symbol:str, start_date:str, end_date:str):
   log.debug("Getting news for %s between %s and %s", symbol, start_date, end_date)
   url = FINNHUB_URL + "/company-news?symbol=" + \
       symbol.upper() + "&from=" + start_date + "&to=" + end_date
-  r = __submit_request(url)
-  return r.json()
+  return records.decode_news(__get_json(url, "news", [], records.project_news))
+
+
+def stream_company_news(symbol:str, start_date:str, end_date:str):
+  """
+  Returns the company news response before its body is downloaded, or None if the request failed.
+  Read the articles with iter_articles. Streamed responses are not cached, see news_digest.get_company_news_digest
+
+  Parameters:
+  symbol: stock symbol as str
+  start_date: start date in format YYYY-MM-DD as str
+  end_date: end date in format YYYY-MM-DD as str
+  """
+  __validate_date(start_date)
+  __validate_date(end_date)
+  log.debug("Streaming news for %s between %s and %s", symbol, start_date, end_date)
+  url = FINNHUB_URL + "/company-news?symbol=" + \
+      symbol.upper() + "&from=" + start_date + "&to=" + end_date
+  return __submit_request(url, stream=True)
+
+
+def iter_articles(r):
+  """
+  Yields the articles of a streamed company news response as records.NewsArticle as they download and parse.
+  Raises ValueError when the response is not a list of articles
+
+  Parameters:
+  r: response returned by stream_company_news
+  """
+  for article in json_stream.iter_array(json_stream.iter_text(r, "finnhub")):
+    if isinstance(article, dict):
+      yield records.NewsArticle.from_json(article)
 
 
 def get_general_news(category="general", minId=0):
@@ -53,8 +102,7 @@ def get_general_news(category="general", minId=0):
 
   log.debug("Getting general news for %s", category)
   url = FINNHUB_URL + "/news?category=" + category + "&minId=" + str(minId)
-  r = __submit_request(url)
-  return r.json()
+  return __get_json(url, "news", [])
 
 
 def get_company_profile(stock: str):
@@ -66,19 +114,17 @@ def get_company_profile(stock: str):
   """
   url = FINNHUB_URL + "/stock/profile2?symbol=" + str(stock.upper())
   log.debug("Getting company profile for %s", stock)
-  r = __submit_request(url)
-  return r.json()
+  return __get_json(url, "profile", {})
 
 
 def get_stock_quote(symbol: str):
   """ 
-  Returns quote for a stock 
+  Returns quote for a stock with the fields kept by records.QuoteTable
   """
   symbol = symbol.upper()
   url = FINNHUB_URL + "/quote?symbol=" + symbol
   log.debug("Getting stock quote for %s", symbol)
-  r = __submit_request(url)
-  return r.json() 
+  return __get_json(url, "quote", {}, records.project_quote)
 
 
 def get_stock_candle(symbol: str, resolution: str, start_date: str, end_date: str):
@@ -110,8 +156,26 @@ def get_stock_candle(symbol: str, resolution: str, start_date: str, end_date: st
 
   url = FINNHUB_URL + "/stock/candle?symbol=" + symbol + "&resolution=" + resolution + "&from=" + start_time + "&to=" + end_time
   log.info("Getting stock candle for %s with [resolution: %s, start time: %s, end time: %s]", symbol, resolution, start_date, end_date)
-  r = __submit_request(url)
-  return r.json()
+  return __get_json(url, "candle", {})
+
+
+def store_daily_candles(symbol: str, end_date: str) -> None:
+  """
+  Appends the daily candles a symbol is missing to the local price store
+
+  Parameters:
+  symbol: stock symbol as str
+  end_date: date of the last candle in format YYYY-MM-DD as str
+  """
+  last = price_store.last_date(symbol)
+  if last is None:
+    last = datetime.date.today() - datetime.timedelta(days=settings.PRICE_HISTORY_DAYS)
+  candle = get_stock_candle(symbol, "D", last.strftime("%Y-%m-%d"), end_date)
+  if candle.get("s") != "ok":
+    log.warning("No candles returned for %s since %s", symbol, str(last))
+    return
+  dates = [datetime.datetime.fromtimestamp(t, timezone.utc).date() for t in candle["t"]]
+  price_store.append(symbol, price_store.to_records(dates, candle["o"], candle["h"], candle["l"], candle["c"]))
 
 
 def get_company_financials(value:str, type:str, accessNumber:str, freq="annual"):
@@ -139,6 +203,5 @@ def get_company_financials(value:str, type:str, accessNumber:str, freq="annual")
   else:
     url += ("cik=" + value)
   log.debug("Getting financial statements for %s at frequency %s", value, freq)
-  r = __submit_request(url)
-  return r.json()
+  return __get_json(url, "financials", {})
 
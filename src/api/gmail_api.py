@@ -4,7 +4,17 @@ from googleapiclient.discovery import build
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.oauth2 import service_account
 from google.auth.transport.requests import Request
+from googleapiclient.errors import HttpError
+import google_auth_httplib2
+import httplib2
 from .. import settings
+from .. import metrics
+from . import rate_limiter
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import itertools
+import random
+import time
 
 import logging as log
 # reading report
@@ -47,31 +57,6 @@ def __create_email(sender, to, subject, report):
   return {'raw' : raw}
 
 
-def __send_email(service, sender, message):
-  try:
-    message = service.users().messages(). \
-    send(userId=sender, body=message).execute()
-    log.info("Message Id: %s", message['id'])
-    return message
-  except Exception as e:
-    log.error("An error occured when trying to send the email: %s", e)
-    return None
-
-
-def __find_report(client,files):
-  lo,hi = 0,len(files)
-  while lo <= hi:
-    m = (lo+hi) // 2
-    fname = files[m].split("_report")[0]
-    if fname == client:
-      return files[m]
-    elif fname < client:
-      lo = m+1
-    else:
-      hi = m-1
-  return None
-
-
 def __get_credentials():
   # Credit: SeattleDataGuy - https://medium.com/better-programming/how-to-automate-your-emails-with-python-386b4e2d5395
 
@@ -99,19 +84,191 @@ def __get_credentials():
   return creds
 
 
-def email_report(sender, client, reports_dir):
-  subject = "Stock Report for " + datetime.today().strftime("%Y-%m-%d")
+class FakeRequest:
+  def __init__(self, service, user_id, body):
+    self.service = service
+    self.user_id = user_id
+    self.body = body
+
+  def execute(self, http=None):
+    return self.service.deliver(self.user_id, self.body)
+
+
+class FakeBatch:
+  def __init__(self, service, callback):
+    self.service = service
+    self.callback = callback
+    self.requests = []
+
+  def add(self, request, request_id=None):
+    self.requests.append((request_id, request))
+
+  def execute(self, http=None):
+    # one round trip per batch
+    time.sleep(self.service.latency)
+    for request_id, request in self.requests:
+      try:
+        self.callback(request_id, request.execute(), None)
+      except HttpError as e:
+        self.callback(request_id, None, e)
+
+
+class FakeService:
+  """
+  In memory stand in for the gmail service, used to run the email stage offline.
+  Delivered messages are kept in `sent`, every batch request takes `latency` seconds and a fraction of sends fail with a retryable error
+  """
+
+  def __init__(self, failure_rate=0.0, latency=0.0):
+    self.failure_rate = failure_rate
+    self.latency = latency
+    self.sent = []
+    self.ids = itertools.count(1)
+    self.lock = threading.Lock()
+
+  def users(self):
+    return self
+
+  def messages(self):
+    return self
+
+  def send(self, userId, body):
+    return FakeRequest(self, userId, body)
 
-  files = os.listdir(reports_dir)
-  files = sorted(files)
-  report = __find_report(client, files)
-  report_path = os.path.join(reports_dir,report)
+  def new_batch_http_request(self, callback=None):
+    return FakeBatch(self, callback)
 
-  message = __create_email(sender, client, subject, report_path)
+  def deliver(self, user_id, body) -> dict:
+    if random.random() < self.failure_rate:
+      raise HttpError(httplib2.Response({"status": 503}), b"Backend Error")
+    with self.lock:
+      message_id = "fake-" + str(next(self.ids))
+      self.sent.append((message_id, user_id, body))
+    return {"id": message_id}
+
+
+__service = None
+__creds = None
+__service_lock = threading.Lock()
+__thread_http = threading.local()
+
+
+def get_service():
+  """
+  Returns the email service selected by settings.GMAIL_BACKEND, loading the credentials and building the service once per run
+  """
+  global __service, __creds
+  with __service_lock:
+    if __service is None:
+      if settings.GMAIL_BACKEND == "fake":
+        __service = FakeService(settings.GMAIL_FAKE_FAILURE_RATE, settings.GMAIL_FAKE_LATENCY)
+      else:
+        __creds = __get_credentials()
+        __service = build('gmail', 'v1', credentials=__creds, cache_discovery=False)
+    return __service
+
+
+def __get_http():
+  # httplib2 connections are not thread safe, so every sending thread authorizes its own
+  if __creds is None:
+    return None
+  if getattr(__thread_http, "http", None) is None:
+    __thread_http.http = google_auth_httplib2.AuthorizedHttp(__creds, http=httplib2.Http())
+  return __thread_http.http
+
+
+def __is_retryable(e) -> bool:
+  if not isinstance(e, HttpError):
+    # the batch request itself failed to reach gmail
+    return True
+  status = e.resp.status
+  return status in rate_limiter.RETRY_STATUS_CODES or (status == 403 and b"ateLimitExceeded" in (e.content or b""))
+
+
+def __send_batch(service, sender, batch_messages) -> dict:
+  """
+  Sends messages with a single batch request and returns a dictionary of client to (response, error)
+  """
+  results = {}
+
+  def callback(request_id, response, exception):
+    results[request_id] = (response, exception)
+
+  batch = service.new_batch_http_request(callback=callback)
+  for client, message in batch_messages:
+    rate_limiter.acquire("gmail")
+    batch.add(service.users().messages().send(userId=sender, body=message), request_id=client)
+  start = time.perf_counter()
+  try:
+    batch.execute(http=__get_http())
+  except Exception as e:
+    metrics.inc("api_requests_total", provider="gmail", status="error")
+    log.warning("Batch of %d emails failed with %s", len(batch_messages), e)
+    return {client: (None, e) for client, _ in batch_messages}
+  metrics.observe("api_request_seconds", time.perf_counter() - start, provider="gmail")
+  metrics.inc("api_requests_total", provider="gmail", status="batch")
+  return results
+
+
+def create_message(sender, client, report_path) -> dict:
+  """
+  Returns the gmail message of a client's report
+
+  Parameters:
+  sender: email address of the sender
+  client: email address of the client
+  report_path: path to the client's html report
+  """
+  subject = "Stock Report for " + datetime.today().strftime("%Y-%m-%d")
+  return __create_email(sender, client, subject, report_path)
 
-  creds = __get_credentials()
 
-  service = build('gmail', 'v1', credentials=creds, cache_discovery=False)
-  __send_email(service, sender, message)
+def send_messages(sender, messages: dict, on_sent=None) -> dict:
+  """
+  Sends messages in batches of settings.GMAIL_BATCH_SIZE with at most settings.GMAIL_MAX_IN_FLIGHT batches in flight.
+  Messages that fail with a throttling or server error are retried up to settings.MAX_RETRIES times.
+  Returns a dictionary of client to message id, or None if the message could not be sent
 
-  log.info("Message sent to %s", client)
+  Parameters:
+  sender: email address of the sender
+  messages: dictionary of client email to message built with create_message
+  on_sent: optional callback called with the dictionary of client to message id of every sent batch
+  """
+  service = get_service()
+  sent = {}
+  pending = dict(messages)
+  start = time.perf_counter()
+  for attempt in range(settings.MAX_RETRIES + 1):
+    items = list(pending.items())
+    batches = [items[i:i + settings.GMAIL_BATCH_SIZE] for i in range(0, len(items), settings.GMAIL_BATCH_SIZE)]
+    retry = {}
+    with ThreadPoolExecutor(max_workers=max(1, settings.GMAIL_MAX_IN_FLIGHT)) as executor:
+      for results in executor.map(lambda b: __send_batch(service, sender, b), batches):
+        batch_sent = {}
+        for client, (response, error) in results.items():
+          if error is None:
+            batch_sent[client] = response["id"]
+            log.debug("Message %s sent to %s", response["id"], client)
+          elif __is_retryable(error) and attempt < settings.MAX_RETRIES:
+            retry[client] = pending[client]
+          else:
+            log.error("An error occured when trying to send the email to %s: %s", client, error)
+            sent[client] = None
+        sent.update(batch_sent)
+        if on_sent is not None and batch_sent:
+          on_sent(batch_sent)
+    pending = retry
+    if not pending:
+      break
+    delay = rate_limiter.get_backoff(attempt)
+    rate_limiter.pause("gmail", delay)
+    log.warning("Retrying %d emails in %.2fs (attempt %d)", len(pending), delay, attempt + 1)
+    time.sleep(delay)
+  count = sum(1 for m in sent.values() if m is not None)
+  elapsed = time.perf_counter() - start
+  metrics.inc("emails_sent_total", count)
+  metrics.inc("emails_failed_total", len(messages) - count)
+  if elapsed > 0:
+    metrics.set_gauge("emails_per_second", count / elapsed)
+  log.info("Sent %d of %d emails in %.2fs", count, len(messages), elapsed)
+  return sent
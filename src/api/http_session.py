@@ -0,0 +1,36 @@
+from .. import settings
+import requests
+from requests.adapters import HTTPAdapter
+import threading
+import logging as log
+
+__session = None
+__lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+  """
+  Returns the process wide session whose connection pool keeps connections to each api host alive between requests
+  """
+  global __session
+  with __lock:
+    if __session is None:
+      session = requests.Session()
+      adapter = HTTPAdapter(pool_connections=settings.HTTP_POOL_CONNECTIONS, pool_maxsize=settings.HTTP_POOL_SIZE)
+      session.mount("https://", adapter)
+      session.mount("http://", adapter)
+      session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+      log.debug("Created http session with pool size %d", settings.HTTP_POOL_SIZE)
+      __session = session
+    return __session
+
+
+def get(url: str, **kwargs) -> requests.Response:
+  """
+  Submits a GET request on the pooled session with the configured connect and read timeouts
+
+  Parameters:
+  url: full request url
+  """
+  kwargs.setdefault("timeout", (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT))
+  return get_session().get(url, **kwargs)
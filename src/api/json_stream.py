@@ -0,0 +1,72 @@
+from .. import settings
+from .. import metrics
+import codecs
+import json
+
+__decoder = json.JSONDecoder()
+__whitespace = " \t\n\r"
+__separators = __whitespace + ",]"
+
+
+def iter_text(r, provider: str):
+  """
+  Yields the body of a streamed response as text chunks of settings.NEWS_STREAM_CHUNK_SIZE bytes
+
+  Parameters:
+  r: response returned by rate_limiter.submit_request with stream=True
+  provider: provider the downloaded bytes are counted for
+  """
+  decoder = codecs.getincrementaldecoder(r.encoding or "utf-8")(errors="replace")
+  for chunk in r.iter_content(chunk_size=settings.NEWS_STREAM_CHUNK_SIZE):
+    metrics.inc("api_response_bytes_total", len(chunk), provider=provider)
+    yield decoder.decode(chunk)
+  yield decoder.decode(b"", final=True)
+
+
+def iter_array(chunks):
+  """
+  Yields the elements of a json array as soon as each is parsed from a sequence of text chunks, so the whole
+  array is never held in memory. Raises ValueError when the text is not a json array
+
+  Parameters:
+  chunks: iterable of text chunks, e.g. iter_text(r, "finnhub")
+  """
+  chunks = iter(chunks)
+  buffer = ""
+  pos = 0
+  opened = False
+  eof = False
+  while True:
+    while pos < len(buffer) and buffer[pos] in __whitespace:
+      pos += 1
+    end = None
+    if pos < len(buffer):
+      c = buffer[pos]
+      if not opened:
+        if c != "[":
+          raise ValueError("Expected a json array, got " + buffer[pos:pos + 40])
+        opened = True
+        pos += 1
+        continue
+      if c == "]":
+        return
+      if c == ",":
+        pos += 1
+        continue
+      try:
+        value, end = __decoder.raw_decode(buffer, pos)
+      except json.JSONDecodeError:
+        end = None
+      # an element is only complete once followed by a separator, e.g. 25 may be the start of 25.5 in the next chunk
+      if end is not None and (eof or (end < len(buffer) and buffer[end] in __separators)):
+        pos = end
+        yield value
+        continue
+    if eof:
+      raise ValueError("Truncated json array")
+    chunk = next(chunks, None)
+    if chunk is None:
+      eof = True
+    else:
+      buffer = buffer[pos:] + chunk
+      pos = 0
@@ -1,18 +1,30 @@
 from .. import settings
-import requests
+from . import rate_limiter
+from . import response_cache
 import logging as log
 import datetime
 import urllib.parse
 
-NEWS_URL = "https://newsapi.org/v2"
+NEWS_URL = settings.NEWS_URL
 
 def __submit_request(url):
   url += ("&apiKey=" + settings.NEWS_KEY)
-  r = requests.get(url)
-  if r.status_code == 200:
-    return r
-  log.error("Request %s failed with status %s and message %s",
-            url, str(r.status_code), r.text)
+  return rate_limiter.submit_request("news", url)
+
+
+def __get_json(url, default):
+  """
+  Returns the json body of a request, served from the response cache when a fresh copy exists
+  """
+  data = response_cache.get("headlines", url)
+  if data is not None:
+    return data
+  r = __submit_request(url)
+  if r is None:
+    return default
+  data = r.json()
+  response_cache.put("headlines", url, data)
+  return data
 
 
 def __validate_date(date):
@@ -34,8 +46,7 @@ def get_top_headlines_by_category(category: str) -> [dict]:
   if category in categories:
     log.debug("Getting top headlines for category %s", category)
     url = NEWS_URL + "/top-headlines?country=us&category=" + category
-    r = __submit_request(url)
-    return r.json()
+    return __get_json(url, {})
   log.debug("%s category not found. Defaulting to query search")
   return get_top_headlines_by_query(category)
 
@@ -49,5 +60,4 @@ def get_top_headlines_by_query(query: str) -> [dict]:
   """
   log.debug("Getting top headlines for %s", query)
   url = NEWS_URL + "/top-headlines?country=us&q=" + urllib.parse.quote(query)
-  r = __submit_request(url)
-  return r.json()
\ No newline at end of file
+  return __get_json(url, {})
\ No newline at end of file
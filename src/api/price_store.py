@@ -0,0 +1,95 @@
+from .. import settings
+import numpy as np
+import threading
+import datetime
+import logging as log
+import os
+
+PRICE_DTYPE = np.dtype([("date", "datetime64[D]"), ("open", "f8"), ("high", "f8"), ("low", "f8"), ("close", "f8")])
+
+__lock = threading.Lock()
+
+
+def __path(symbol: str) -> str:
+  return os.path.join(settings.PRICE_STORE_DIR, symbol.upper() + ".npy")
+
+
+def to_records(dates, opens, highs, lows, closes) -> np.ndarray:
+  """
+  Returns a structured array of daily bars in PRICE_DTYPE sorted by date
+
+  Parameters:
+  dates: bar dates convertible to datetime64[D]
+  opens, highs, lows, closes: bar prices
+  """
+  records = np.empty(len(dates), dtype=PRICE_DTYPE)
+  records["date"] = np.asarray(dates, dtype="datetime64[D]")
+  records["open"] = opens
+  records["high"] = highs
+  records["low"] = lows
+  records["close"] = closes
+  return np.sort(records, order="date")
+
+
+def read(symbol: str) -> np.ndarray:
+  """
+  Returns all stored daily bars of a symbol as a read only memory mapped array
+
+  Parameters:
+  symbol: stock symbol
+  """
+  path = __path(symbol)
+  if not os.path.exists(path):
+    return np.empty(0, dtype=PRICE_DTYPE)
+  return np.load(path, mmap_mode="r")
+
+
+def read_window(symbol: str, days: int) -> np.ndarray:
+  """
+  Returns the stored daily bars of a symbol from the last `days` calendar days
+
+  Parameters:
+  symbol: stock symbol
+  days: size of the window in calendar days
+  """
+  records = read(symbol)
+  start = np.datetime64(datetime.date.today() - datetime.timedelta(days=days), "D")
+  return records[np.searchsorted(records["date"], start):]
+
+
+def last_date(symbol: str):
+  """
+  Returns the date of the most recent stored bar of a symbol as datetime.date, or None when nothing is stored
+
+  Parameters:
+  symbol: stock symbol
+  """
+  records = read(symbol)
+  if not len(records):
+    return None
+  return records["date"][-1].astype(datetime.date)
+
+
+def append(symbol: str, records: np.ndarray) -> None:
+  """
+  Appends new daily bars of a symbol to the store. Bars on or after the first new date replace the stored ones,
+  and bars older than settings.PRICE_STORE_MAX_DAYS are dropped
+
+  Parameters:
+  symbol: stock symbol
+  records: structured array in PRICE_DTYPE sorted by date, see to_records
+  """
+  records = records[~np.isnan(records["close"])]
+  if not len(records):
+    return
+  with __lock:
+    os.makedirs(settings.PRICE_STORE_DIR, exist_ok=True)
+    stored = np.array(read(symbol))
+    merged = np.concatenate([stored[stored["date"] < records["date"][0]], records])
+    cutoff = np.datetime64(datetime.date.today() - datetime.timedelta(days=settings.PRICE_STORE_MAX_DAYS), "D")
+    merged = merged[merged["date"] >= cutoff]
+    path = __path(symbol)
+    tmp_path = path + ".tmp.npy"
+    np.save(tmp_path, merged)
+    os.replace(tmp_path, path)
+  log.debug("Stored %d new bars for %s", len(records), symbol)
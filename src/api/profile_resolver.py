@@ -0,0 +1,105 @@
+from .. import settings
+from .. import metrics
+from . import finnhub_api
+from . import yfinance_api
+from . import response_cache
+from ..records import Profile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import threading
+import logging as log
+
+# Company profiles come from finnhub, or from yfinance's much slower Ticker.info for the symbols finnhub does not
+# cover, e.g. many ADRs and ETFs. Instead of waiting for finnhub to come back empty before asking yfinance, a
+# symbol's profile is raced across both:
+#
+#   finnhub ──────────────────────────> first usable profile wins, the other request is cancelled or ignored
+#   └─ PROFILE_HEDGE_DELAY ─> yfinance ─┘
+#
+# yfinance starts early when finnhub answers with an empty profile. The source that answered is remembered in the
+# response cache, so later runs ask it directly and only race again when it stops answering.
+
+__lock = threading.Lock()
+__executor = None
+
+
+def __finnhub(s: str):
+  p = finnhub_api.get_company_profile(s)
+  if len(p) == 0:
+    return None
+  return Profile(p.get("name", s), p.get("finnhubIndustry", s))
+
+
+def __yfinance(s: str):
+  p = yfinance_api.get_stock_profile(s)
+  if len(p) == 0:
+    return None
+  return Profile(p.get("shortName", s), p.get("sector", s))
+
+
+SOURCES = {"finnhub": __finnhub, "yfinance": __yfinance}
+
+
+def __get_executor() -> ThreadPoolExecutor:
+  global __executor
+  with __lock:
+    if __executor is None:
+      # both sources of every profile lookup in flight may run at once
+      __executor = ThreadPoolExecutor(max_workers=2 * settings.FINNHUB_MAX_IN_FLIGHT, thread_name_prefix="profile")
+    return __executor
+
+
+def __usable(future, source: str, s: str):
+  try:
+    return future.result()
+  except Exception as e:
+    log.debug("Profile lookup of %s from %s failed: %s", s, source, str(e))
+    return None
+
+
+def __race(s: str):
+  executor = __get_executor()
+  pending = {executor.submit(SOURCES["finnhub"], s): "finnhub"}
+  hedged = False
+  while pending:
+    done, _ = wait(pending, timeout=None if hedged else settings.PROFILE_HEDGE_DELAY, return_when=FIRST_COMPLETED)
+    for future in done:
+      source = pending.pop(future)
+      profile = __usable(future, source, s)
+      if profile is not None:
+        for other in pending:
+          # a request that already started finishes in the background and only fills the response cache
+          other.cancel()
+        return source, profile
+    if not hedged:
+      hedged = True
+      if not done:
+        metrics.inc("profile_hedges_total")
+      pending[executor.submit(SOURCES["yfinance"], s)] = "yfinance"
+  return None, None
+
+
+def resolve(s: str) -> Profile:
+  """
+  Returns the profile of a company from whichever of finnhub and yfinance answers first
+
+  Parameters:
+  s: stock symbol
+  """
+  source = response_cache.get("profile_source", s)
+  if source in SOURCES:
+    try:
+      profile = SOURCES[source](s)
+    except Exception as e:
+      log.debug("Profile lookup of %s from %s failed: %s", s, source, str(e))
+      profile = None
+    if profile is not None:
+      metrics.inc("profile_source_total", source=source, raced="false")
+      return profile
+    log.info("Remembered profile source %s of %s has no profile. Asking every source", source, s)
+  source, profile = __race(s)
+  if profile is None:
+    log.warn("No profile data was found of %s. Skipping", s)
+    return Profile("", "")
+  metrics.inc("profile_source_total", source=source, raced="true")
+  response_cache.put("profile_source", s, source)
+  return profile
@@ -0,0 +1,167 @@
+from .. import settings
+from .. import metrics
+from . import http_session
+import requests
+import threading
+import random
+import time
+import email.utils
+import logging as log
+
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+
+class TokenBucket:
+  """
+  Thread safe token bucket holding at most `rate` tokens, refilled at `rate` tokens every `per` seconds
+  """
+
+  def __init__(self, rate: float, per: float):
+    self.capacity = float(rate)
+    self.tokens = float(rate)
+    self.fill_rate = float(rate) / per
+    self.updated = time.monotonic()
+    self.lock = threading.Lock()
+
+  def reserve(self) -> float:
+    """
+    Takes a token from the bucket and returns the number of seconds to wait before it may be used
+    """
+    with self.lock:
+      now = time.monotonic()
+      self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+      self.updated = now
+      self.tokens -= 1
+      if self.tokens >= 0:
+        return 0.0
+      return -self.tokens / self.fill_rate
+
+
+class ProviderLimiter:
+  """
+  Paces requests to a single provider with a requests/second and a requests/minute bucket.
+  A throttled response pauses every caller of the provider until the provider allows requests again
+  """
+
+  def __init__(self, name: str, per_second: float, per_minute: float):
+    self.name = name
+    self.buckets = [TokenBucket(per_second, 1), TokenBucket(per_minute, 60)]
+    self.paused_until = 0.0
+    self.lock = threading.Lock()
+
+  def acquire(self) -> None:
+    wait = max(bucket.reserve() for bucket in self.buckets)
+    with self.lock:
+      wait = max(wait, self.paused_until - time.monotonic())
+    if wait > 0:
+      log.debug("Waiting %.2fs for %s rate limit", wait, self.name)
+      time.sleep(wait)
+
+  def pause(self, seconds: float) -> None:
+    with self.lock:
+      self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+__limiters = {
+  "finnhub": ProviderLimiter("finnhub", settings.FINNHUB_RATE_PER_SECOND, settings.FINNHUB_RATE_PER_MINUTE),
+  "news": ProviderLimiter("news", settings.NEWS_RATE_PER_SECOND, settings.NEWS_RATE_PER_MINUTE),
+  "gmail": ProviderLimiter("gmail", settings.GMAIL_RATE_PER_SECOND, settings.GMAIL_RATE_PER_MINUTE)
+}
+
+
+def acquire(provider: str) -> None:
+  """
+  Waits until the provider's rate limits allow one more request, for clients that do not send through submit_request
+
+  Parameters:
+  provider: one of the following providers ["finnhub", "news", "gmail"]
+  """
+  __limiters[provider].acquire()
+
+
+def pause(provider: str, seconds: float) -> None:
+  """
+  Pauses every caller of the provider after a throttled response
+
+  Parameters:
+  provider: one of the following providers ["finnhub", "news", "gmail"]
+  seconds: number of seconds to pause for
+  """
+  __limiters[provider].pause(seconds)
+
+
+def __retry_after(r) -> float:
+  """
+  Returns the number of seconds requested by a Retry-After header, or None when missing or invalid
+  """
+  value = r.headers.get("Retry-After")
+  if value is None:
+    return None
+  try:
+    return max(0.0, float(value))
+  except ValueError:
+    pass
+  try:
+    return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+  except (TypeError, ValueError):
+    return None
+
+
+def get_backoff(attempt: int, retry_after=None) -> float:
+  """
+  Returns the number of seconds to wait before retrying a request, using full jitter exponential backoff
+
+  Parameters:
+  attempt: number of failed attempts so far, starting at 0
+  retry_after: seconds requested by the provider, used as the lower bound when present
+  """
+  delay = random.uniform(0, min(settings.BACKOFF_CAP, settings.BACKOFF_BASE * (2 ** attempt)))
+  if retry_after is not None:
+    delay = max(delay, retry_after)
+  return delay
+
+
+def submit_request(provider: str, url: str, stream=False):
+  """
+  Submits a GET request paced by the provider's rate limits, retrying throttled and failed requests.
+  Returns the response, or None if the request did not succeed after settings.MAX_RETRIES retries
+
+  Parameters:
+  provider: one of the following providers ["finnhub", "news"]
+  url: full request url
+  stream: return a successful response before its body is downloaded, see json_stream.iter_text
+  """
+  limiter = __limiters[provider]
+  r = None
+  for attempt in range(settings.MAX_RETRIES + 1):
+    limiter.acquire()
+    start = time.perf_counter()
+    try:
+      r = http_session.get(url, stream=stream)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+      metrics.inc("api_requests_total", provider=provider, status="error")
+      log.warning("Request %s failed with %s (attempt %d)", url, e, attempt + 1)
+      r = None
+      if attempt < settings.MAX_RETRIES:
+        time.sleep(get_backoff(attempt))
+      continue
+    metrics.observe("api_request_seconds", time.perf_counter() - start, provider=provider)
+    metrics.inc("api_requests_total", provider=provider, status=str(r.status_code))
+    if r.status_code != 200 or not stream:
+      # streamed bodies are counted as they are read
+      metrics.inc("api_response_bytes_total", len(r.content), provider=provider)
+    if r.status_code == 200:
+      return r
+    if r.status_code not in RETRY_STATUS_CODES or attempt == settings.MAX_RETRIES:
+      break
+    delay = get_backoff(attempt, __retry_after(r))
+    if r.status_code == 429:
+      limiter.pause(delay)
+    log.warning("Request %s returned status %s, retrying in %.2fs (attempt %d)",
+                url, str(r.status_code), delay, attempt + 1)
+    time.sleep(delay)
+  if r is not None:
+    log.error("Request %s failed with status %s and message %s", url, str(r.status_code), r.text)
+  else:
+    log.error("Request %s failed after %d attempts", url, settings.MAX_RETRIES + 1)
+  return None
@@ -0,0 +1,176 @@
+from .. import settings
+import sqlite3
+import threading
+import json
+import time
+import os
+import logging as log
+
+__lock = threading.Lock()
+__conn = None
+__total_size = None
+__hits = {}
+__misses = {}
+
+
+def __connect() -> sqlite3.Connection:
+  global __conn
+  if __conn is None:
+    directory = os.path.dirname(settings.CACHE_PATH)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    __conn = sqlite3.connect(settings.CACHE_PATH, check_same_thread=False, isolation_level=None)
+    __conn.execute("PRAGMA journal_mode=WAL")
+    __conn.execute("PRAGMA synchronous=NORMAL")
+    __conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+      key TEXT PRIMARY KEY, endpoint TEXT, value TEXT, size INTEGER, created REAL, accessed REAL)""")
+    __conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+    log.debug("Opened response cache at %s", settings.CACHE_PATH)
+  return __conn
+
+
+def __evict(conn) -> None:
+  """
+  Removes expired entries, then least recently used entries until the cache is below settings.CACHE_MAX_BYTES
+  """
+  global __total_size
+  now = time.time()
+  for endpoint, ttl in settings.CACHE_TTLS.items():
+    conn.execute("DELETE FROM responses WHERE endpoint = ? AND created < ?", (endpoint, now - ttl))
+  __total_size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+  target = settings.CACHE_MAX_BYTES * 0.9
+  if __total_size <= target:
+    return
+  victims = []
+  for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+    if __total_size <= target:
+      break
+    victims.append((key,))
+    __total_size -= size
+  conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+  log.debug("Evicted %d entries from response cache", len(victims))
+
+
+def __stored_size(conn, keys: list) -> int:
+  """
+  Returns the total size of the entries stored under keys, the bytes freed when they are replaced
+  """
+  size = 0
+  for i in range(0, len(keys), 500):
+    batch = keys[i:i + 500]
+    size += conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses WHERE key IN (%s)" % ",".join("?" * len(batch)),
+                         batch).fetchone()[0]
+  return size
+
+
+def get(endpoint: str, key: str):
+  """
+  Returns the cached value for a request, or None if it is missing or older than the endpoint's ttl
+
+  Parameters:
+  endpoint: name of the endpoint, one of the keys of settings.CACHE_TTLS
+  key: request parameters that identify the response, e.g. the request url without credentials
+  """
+  if not settings.CACHE_ENABLED:
+    return None
+  with __lock:
+    conn = __connect()
+    row = conn.execute("SELECT value, created FROM responses WHERE key = ?", (endpoint + ":" + key,)).fetchone()
+    now = time.time()
+    if row is None or row[1] < now - settings.CACHE_TTLS[endpoint]:
+      __misses[endpoint] = __misses.get(endpoint, 0) + 1
+      return None
+    conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, endpoint + ":" + key))
+    __hits[endpoint] = __hits.get(endpoint, 0) + 1
+  return json.loads(row[0])
+
+
+def put(endpoint: str, key: str, value) -> None:
+  """
+  Stores a json serializable value for a request
+
+  Parameters:
+  endpoint: name of the endpoint, one of the keys of settings.CACHE_TTLS
+  key: request parameters that identify the response
+  value: json serializable response
+  """
+  global __total_size
+  if not settings.CACHE_ENABLED:
+    return
+  data = json.dumps(value, separators=(",", ":"), default=str)
+  now = time.time()
+  with __lock:
+    conn = __connect()
+    if __total_size is None:
+      __evict(conn)
+    replaced = __stored_size(conn, [endpoint + ":" + key])
+    conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                 (endpoint + ":" + key, endpoint, data, len(data), now, now))
+    __total_size += len(data) - replaced
+    if __total_size > settings.CACHE_MAX_BYTES:
+      __evict(conn)
+
+
+def get_many(endpoint: str, keys: list) -> dict:
+  """
+  Returns a dictionary of key to cached value for the keys that have a fresh cached value
+
+  Parameters:
+  endpoint: name of the endpoint, one of the keys of settings.CACHE_TTLS
+  keys: list of request keys
+  """
+  if not settings.CACHE_ENABLED or not keys:
+    return {}
+  found = {}
+  now = time.time()
+  with __lock:
+    conn = __connect()
+    for i in range(0, len(keys), 500):
+      batch = [endpoint + ":" + k for k in keys[i:i + 500]]
+      rows = conn.execute("SELECT key, value, created FROM responses WHERE key IN (%s)" % ",".join("?" * len(batch)), batch)
+      for key, value, created in rows:
+        if created >= now - settings.CACHE_TTLS[endpoint]:
+          found[key[len(endpoint) + 1:]] = value
+      conn.executemany("UPDATE responses SET accessed = ? WHERE key = ?",
+                       [(now, endpoint + ":" + k) for k in keys[i:i + 500] if k in found])
+    __hits[endpoint] = __hits.get(endpoint, 0) + len(found)
+    __misses[endpoint] = __misses.get(endpoint, 0) + len(keys) - len(found)
+  return {k: json.loads(v) for k, v in found.items()}
+
+
+def put_many(endpoint: str, values: dict) -> None:
+  """
+  Stores a dictionary of request key to json serializable value
+
+  Parameters:
+  endpoint: name of the endpoint, one of the keys of settings.CACHE_TTLS
+  values: dictionary of request key to value
+  """
+  global __total_size
+  if not settings.CACHE_ENABLED or not values:
+    return
+  now = time.time()
+  rows = []
+  for key, value in values.items():
+    data = json.dumps(value, separators=(",", ":"), default=str)
+    rows.append((endpoint + ":" + key, endpoint, data, len(data), now, now))
+  with __lock:
+    conn = __connect()
+    if __total_size is None:
+      __evict(conn)
+    conn.execute("BEGIN")
+    replaced = __stored_size(conn, [row[0] for row in rows])
+    conn.executemany("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)", rows)
+    conn.execute("COMMIT")
+    __total_size += sum(row[3] for row in rows) - replaced
+    if __total_size > settings.CACHE_MAX_BYTES:
+      __evict(conn)
+
+
+def stats() -> dict:
+  """
+  Returns a dictionary of endpoint to its cache hits and misses for this run
+  """
+  with __lock:
+    endpoints = set(__hits) | set(__misses)
+    return {e: {"hits": __hits.get(e, 0), "misses": __misses.get(e, 0)} for e in sorted(endpoints)}
@@ -0,0 +1,174 @@
+from .. import settings
+from .. import metrics
+from typing import List
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import datetime
+import hashlib
+import base64
+import pathlib
+import shutil
+import logging as log
+import os
+
+
+class GCSBackend:
+  """
+  Stores files as public objects of a GCP Cloud Storage bucket, sharing one client across uploads
+  """
+
+  def __init__(self, bucket_name: str):
+    from google.cloud import storage
+    self.client = storage.Client()
+    self.bucket = self.client.bucket(bucket_name)
+
+  def existing_hashes(self, prefix: str) -> dict:
+    hashes = {}
+    for blob in self.client.list_blobs(self.bucket, prefix=prefix):
+      if blob.md5_hash:
+        hashes[blob.name] = base64.b64decode(blob.md5_hash).hex()
+    return hashes
+
+  def upload(self, path: str, name: str) -> None:
+    # the public acl is set with the upload instead of a separate make_public request
+    self.bucket.blob(name).upload_from_filename(path, predefined_acl="publicRead")
+
+  def public_url(self, name: str) -> str:
+    return self.bucket.blob(name).public_url
+
+
+class LocalBackend:
+  """
+  Stores files in a local directory, used to run the upload stage offline
+  """
+
+  def __init__(self, root: str):
+    self.root = os.path.abspath(root)
+
+  def existing_hashes(self, prefix: str) -> dict:
+    hashes = {}
+    directory = os.path.join(self.root, prefix)
+    if os.path.isdir(directory):
+      for fname in os.listdir(directory):
+        hashes[prefix + fname] = file_hash(os.path.join(directory, fname))
+    return hashes
+
+  def upload(self, path: str, name: str) -> None:
+    target = os.path.join(self.root, name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.copyfile(path, target)
+
+  def public_url(self, name: str) -> str:
+    return pathlib.Path(os.path.join(self.root, name)).as_uri()
+
+
+__backend = None
+__lock = threading.Lock()
+
+
+def get_backend():
+  """
+  Returns the storage backend selected by settings.STORAGE_BACKEND, either "gcs" or "local"
+  """
+  global __backend
+  with __lock:
+    if __backend is None:
+      if settings.STORAGE_BACKEND == "local":
+        __backend = LocalBackend(settings.LOCAL_STORAGE_DIR)
+      else:
+        __backend = GCSBackend(settings.GCP_BUCKET)
+    return __backend
+
+
+def file_hash(path: str) -> str:
+  """
+  Returns the md5 hex digest of a file, the hash GCP Cloud Storage keeps for every object
+  """
+  md5 = hashlib.md5()
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(1 << 16), b""):
+      md5.update(chunk)
+  return md5.hexdigest()
+
+
+def __today() -> str:
+  return datetime.datetime.today().strftime("%Y%m%d")
+
+
+class Uploader:
+  """
+  Uploads files to the date's folder of the storage backend from one pool of settings.UPLOAD_WORKERS threads shared
+  by every upload call, e.g. the chart uploads of every stock of a run. The folder is listed once, on the first upload,
+  and files whose content is already stored under the same name are skipped. Created with get_uploader
+  """
+
+  def __init__(self, date: str):
+    self.date = date
+    self.backend = get_backend()
+    self.executor = ThreadPoolExecutor(max_workers=max(1, settings.UPLOAD_WORKERS), thread_name_prefix="upload")
+    self.lock = threading.Lock()
+    self.existing = None
+    self.uploaded = 0
+    self.skipped = 0
+
+  def __existing_hashes(self) -> dict:
+    with self.lock:
+      if self.existing is None:
+        self.existing = self.backend.existing_hashes(self.date + "/")
+      return self.existing
+
+  def __upload(self, path: str, fname: str) -> bool:
+    name = self.date + "/" + fname
+    if self.__existing_hashes().get(name) == file_hash(path):
+      log.debug("File %s already stored at %s. Skipping", path, name)
+      return False
+    with metrics.timer("upload_seconds", backend=settings.STORAGE_BACKEND):
+      self.backend.upload(path, name)
+    metrics.inc("uploaded_bytes_total", os.path.getsize(path), backend=settings.STORAGE_BACKEND)
+    log.debug("File %s uploaded to %s", path, name)
+    return True
+
+  def upload(self, files: List[tuple]) -> int:
+    """
+    Uploads files and returns the number of uploaded files once every file is stored
+
+    Parameters:
+    files: list of (path, file name) tuples
+    """
+    futures = [self.executor.submit(self.__upload, path, fname) for path, fname in files]
+    uploaded = sum(f.result() for f in futures)
+    with self.lock:
+      self.uploaded += uploaded
+      self.skipped += len(files) - uploaded
+    return uploaded
+
+  def close(self) -> None:
+    self.executor.shutdown()
+    log.info("Uploaded %d of %d files, %d already stored", self.uploaded, self.uploaded + self.skipped, self.skipped)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+def get_uploader(date=None) -> Uploader:
+  """
+  Returns an Uploader of the date's folder, to be closed once every file is uploaded
+
+  Parameters:
+  date: folder name in format YYYYMMDD. default is today
+  """
+  return Uploader(date or __today())
+
+
+def public_url(fname: str, date=None) -> str:
+  """
+  Returns the public url of a file uploaded with an Uploader
+
+  Parameters:
+  fname: file name
+  date: folder name in format YYYYMMDD. default is today
+  """
+  return get_backend().public_url((date or __today()) + "/" + fname)
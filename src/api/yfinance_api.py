@@ -1,80 +1,136 @@
 from .. import settings
+from .. import metrics
 from typing import List
 import yfinance as yf
 import pandas as pd
-import datetime
-from pandas.plotting import register_matplotlib_converters
 import logging as log
 import os
 import numpy as np
-import matplotlib.pyplot as plt
-from google.cloud import storage
+from . import response_cache
+from . import price_store
 
+PRICE_FIELDS = ["Open", "High", "Low", "Close"]
 
-# Required for converting data types (e.g. dates)
-register_matplotlib_converters()
 
+def __read_local_prices(tickers: List[str], start=None) -> pd.DataFrame:
+  """
+  Reads prices from the local stand-in data source, a directory of ${TICKER}.csv files with Date,Open,High,Low,Close columns
+  """
+  frames = {}
+  for ticker in tickers:
+    fname = os.path.join(settings.PRICE_DATA_DIR, ticker + ".csv")
+    if os.path.exists(fname):
+      df = pd.read_csv(fname, index_col="Date", parse_dates=True)[PRICE_FIELDS]
+      if start is not None:
+        df = df[df.index >= pd.Timestamp(start)]
+      frames[ticker] = df
+    else:
+      log.warning("No local price data found for %s at %s", ticker, fname)
+  if not frames:
+    return pd.DataFrame()
+  return pd.concat(frames, axis=1)
+
+
+def __download_prices(tickers: List[str], **kwargs) -> pd.DataFrame:
+  frames = []
+  for i in range(0, len(tickers), settings.YF_BATCH_SIZE):
+    batch = tickers[i:i + settings.YF_BATCH_SIZE]
+    log.debug("Downloading price history %s for %d tickers", str(kwargs), len(batch))
+    with metrics.timer("api_request_seconds", provider="yfinance"):
+      df = yf.download(batch, group_by="ticker", auto_adjust=False, threads=True, progress=False, **kwargs)
+    metrics.inc("api_requests_total", provider="yfinance", status="batch")
+    if not isinstance(df.columns, pd.MultiIndex):
+      df.columns = pd.MultiIndex.from_product([batch, df.columns])
+    frames.append(df)
+  if not frames:
+    return pd.DataFrame()
+  return pd.concat(frames, axis=1)
+
+
+def load_historical_prices(tickers: List[str], period="3mo", start=None) -> pd.DataFrame:
+  """
+  Returns the OHLC prices of all tickers in one frame with (ticker, field) columns.
+  Prices are downloaded in batches of settings.YF_BATCH_SIZE tickers, or read from settings.PRICE_DATA_DIR when set.
+  Columns are laid out as one contiguous block of PRICE_FIELDS per ticker so get_ticker_prices can slice without copying
+
+  Parameters:
+  tickers: list of stock symbols
+  period: history period to download
+  start: first date to download in format YYYY-MM-DD as str, used instead of period when given
+  """
+  tickers = list(tickers)
+  if settings.PRICE_DATA_DIR:
+    prices = __read_local_prices(tickers, start)
+  elif start is not None:
+    prices = __download_prices(tickers, start=start)
+  else:
+    prices = __download_prices(tickers, period=period)
+  columns = pd.MultiIndex.from_product([tickers, PRICE_FIELDS])
+  values = prices.reindex(columns=columns).to_numpy(dtype=np.float64)
+  prices = pd.DataFrame(values, index=prices.index, columns=columns)
+  log.info("Loaded %d days of prices for %d tickers", len(prices.index), len(tickers))
+  return prices
 
-def __upload_to_gcp_bucket(path, fname,date):
-  storage_client = storage.Client()
-  bucket = storage_client.bucket(settings.GCP_BUCKET)
-  blob = bucket.blob(date + "/" + fname)
-  blob.upload_from_filename(path)
-  blob.make_public()
-  log.debug("File %s uploaded to GCP Bucket at %s", path, date + "/" + fname)
 
+def get_ticker_prices(prices: pd.DataFrame, ticker: str) -> pd.DataFrame:
+  """
+  Returns the OHLC prices of a ticker as a slice of a frame from load_historical_prices
+
+  Parameters:
+  prices: frame returned by load_historical_prices
+  ticker: stock symbol
+  """
+  start = prices.columns.get_loc((ticker, PRICE_FIELDS[0]))
+  df = prices.iloc[:, start:start + len(PRICE_FIELDS)]
+  df.columns = PRICE_FIELDS
+  if df.isna().values.any():
+    df = df.dropna(how="all")
+  return df
 
-def __plot_and_save(df,fname,title):
-  fig, ax = plt.subplots()
-  ax.plot( np.array(df.index), np.array(df['Open']), marker='', color='skyblue', linewidth=2, linestyle='solid', label='Open')
-  ax.plot( np.array(df.index), np.array(df['High']), marker='', color='green', linewidth=2, linestyle='solid', label='High')
-  ax.plot( np.array(df.index), np.array(df['Low']), marker='', color='red', linewidth=2, linestyle='solid', label='Low')
-  ax.plot( np.array(df.index), np.array(df['Close']), marker='', color='black', linewidth=2, linestyle='solid', label='Close')
-  plt.legend()
-  fig.autofmt_xdate()
-  plt.title(title)
-  plt.savefig(fname)
-  plt.close()
+
+def update_price_store(tickers: List[str]) -> None:
+  """
+  Appends the daily bars each ticker is missing to the local price store.
+  Tickers without stored prices get a full 3 month history, the others only the bars since their last stored bar
+
+  Parameters:
+  tickers: list of stock symbols
+  """
+  starts = {}
+  for ticker in tickers:
+    last = price_store.last_date(ticker)
+    start = None if last is None else last.strftime("%Y-%m-%d")
+    starts.setdefault(start, []).append(ticker)
+  for start, group in starts.items():
+    prices = load_historical_prices(group, start=start)
+    dates = np.asarray(prices.index.date, dtype="datetime64[D]")
+    for ticker in group:
+      values = get_ticker_prices(prices, ticker)
+      if not len(values.index):
+        log.warning("No prices were downloaded for %s", ticker)
+        continue
+      rows = prices.index.get_indexer(values.index)
+      price_store.append(ticker, price_store.to_records(dates[rows], values["Open"], values["High"], values["Low"], values["Close"]))
+  log.info("Updated price store for %d tickers", len(tickers))
 
 
-def get_historical_prices(ticker: str, path: str) -> None:
+def get_stored_prices(ticker: str, days=None) -> pd.DataFrame:
   """
-  Creates line charts for 3month,1month and 1week historical stock prices and stores the images in a GCP Cloud Storage bucket
+  Returns the OHLC prices of a ticker over the last `days` calendar days from the local price store
 
   Parameters:
   ticker: stock symbol
-  path: path to the temporary directory
+  days: size of the window in calendar days. default is settings.PRICE_HISTORY_DAYS
   """
-  date = datetime.datetime.today().strftime("%Y%m%d")
-  ticker_path = os.path.join(path,ticker)
-  log.debug("Creating ticker path: %s", str(ticker_path))
-  os.mkdir(ticker_path)
-  ticker_obj = yf.Ticker(ticker)
-  prices_df = ticker_obj.history(period="3mo")
-  if not len(prices_df.index):
-    return 
-  log.debug("Creating 3 month line graph")
-  fname = ticker+"_3mo.png"
-  path = os.path.join(ticker_path, fname)
-  __plot_and_save(prices_df, path, ticker + " - Past 3 months")
-  __upload_to_gcp_bucket(path, fname, date)
-  
-  log.debug("Creating 1 month line graph")
-  fname = ticker+"_1mo.png"
-  path = os.path.join(ticker_path, fname)
-  __plot_and_save(prices_df.iloc[-31:], path, ticker + " - Past 1 month")
-  __upload_to_gcp_bucket(path, fname, date)
-
-  log.debug("Creating 1 week line graph")
-  fname = ticker+"_1wk.png"
-  path = os.path.join(ticker_path, fname)
-  __plot_and_save(prices_df.iloc[-8:], path, ticker + " - Past 1 week")
-  __upload_to_gcp_bucket(path, fname, date)
-
-  log.info("Created graphs for %s and uploaded to GCP Storage Bucket", ticker)
-  
+  records = price_store.read_window(ticker, days or settings.PRICE_HISTORY_DAYS)
+  index = pd.DatetimeIndex(records["date"].astype("datetime64[ns]"), name="Date")
+  return pd.DataFrame({"Open": records["open"], "High": records["high"], "Low": records["low"], "Close": records["close"]}, index=index)
 
 
 def get_stock_profile(ticker:str) -> dict:
-  ticker_obj = yf.Ticker(ticker)
-  return ticker_obj.info
+  profile = response_cache.get("yf_profile", ticker)
+  if profile is None:
+    ticker_obj = yf.Ticker(ticker)
+    profile = ticker_obj.info
+    response_cache.put("yf_profile", ticker, profile)
+  return profile
@@ -0,0 +1,93 @@
+from typing import List
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+import numpy as np
+import logging as log
+import os
+import time
+
+# (file suffix, number of trailing days or None for the full history, title suffix)
+CHART_WINDOWS = [
+  ("_3mo", None, " - Past 3 months"),
+  ("_1mo", 31, " - Past 1 month"),
+  ("_1wk", 8, " - Past 1 week")
+]
+LINES = [("Open", "skyblue"), ("High", "green"), ("Low", "red"), ("Close", "black")]
+
+# figure, axes and lines reused for every chart rendered by this process
+__template = None
+
+
+def __get_template():
+  global __template
+  if __template is None:
+    fig, ax = plt.subplots()
+    lines = []
+    for label, color in LINES:
+      line, = ax.plot([], [], marker='', color=color, linewidth=2, linestyle='solid', label=label)
+      lines.append(line)
+    ax.xaxis_date()
+    ax.legend()
+    __template = (fig, ax, lines)
+  return __template
+
+
+def __plot_and_save(dates, values, fname, title) -> None:
+  fig, ax, lines = __get_template()
+  for line, column in zip(lines, values):
+    line.set_data(dates, column)
+  ax.relim()
+  ax.autoscale_view()
+  ax.set_title(title)
+  fig.autofmt_xdate()
+  fig.savefig(fname)
+
+
+def render_ticker_charts(ticker: str, dates: np.ndarray, values: np.ndarray, path: str) -> List[tuple]:
+  """
+  Creates line charts for 3month,1month and 1week historical stock prices and returns the (path, file name) of each image
+
+  Parameters:
+  ticker: stock symbol
+  dates: bar dates as datetime64 array
+  values: 4 x N array of Open, High, Low and Close prices
+  path: path to the temporary directory
+  """
+  if not len(dates):
+    return []
+  ticker_path = os.path.join(path, ticker)
+  log.debug("Creating ticker path: %s", str(ticker_path))
+  os.makedirs(ticker_path, exist_ok=True)
+  dates = mdates.date2num(dates)
+  charts = []
+  for suffix, days, title in CHART_WINDOWS:
+    fname = ticker + suffix + ".png"
+    chart_path = os.path.join(ticker_path, fname)
+    start = 0 if days is None else -days
+    __plot_and_save(dates[start:], values[:, start:], chart_path, ticker + title)
+    charts.append((chart_path, fname))
+  return charts
+
+
+def chart_job(ticker: str, df, path: str) -> tuple:
+  """
+  Returns the (ticker, dates, values, path) rendering job of a ticker's price frame
+
+  Parameters:
+  ticker: stock symbol
+  df: frame of Open, High, Low and Close prices indexed by date
+  path: path to the temporary directory
+  """
+  values = np.array([np.asarray(df[label], dtype=np.float64) for label, _ in LINES]).reshape(len(LINES), -1)
+  return ticker, np.asarray(df.index.values), values, path
+
+
+def render_job(job) -> tuple:
+  """
+  Renders a job built with chart_job and returns the ticker, its (path, file name) list and the render time in seconds
+  """
+  start = time.perf_counter()
+  charts = render_ticker_charts(*job)
+  return job[0], charts, time.perf_counter() - start
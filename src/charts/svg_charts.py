@@ -0,0 +1,67 @@
+from typing import List
+import numpy as np
+import html
+
+# (file suffix, number of trailing days or None for the full history, title suffix), same windows as png_charts
+CHART_WINDOWS = [
+  ("_3mo", None, " - Past 3 months"),
+  ("_1mo", 31, " - Past 1 month"),
+  ("_1wk", 8, " - Past 1 week")
+]
+LINES = [("open", "skyblue"), ("high", "green"), ("low", "red"), ("close", "black")]
+WIDTH = 640
+HEIGHT = 320
+PADDING = 40
+
+
+def __points(x, y) -> str:
+  return " ".join("%.1f,%.1f" % p for p in zip(x, y))
+
+
+def render_svg(dates: np.ndarray, values: np.ndarray, title: str, css_class: str) -> str:
+  """
+  Returns a compact inline svg line chart of open, high, low and close prices
+
+  Parameters:
+  dates: bar dates as datetime64[D] array
+  values: 4 x N array of Open, High, Low and Close prices
+  title: chart title
+  css_class: class of the svg element in the report
+  """
+  days = dates.astype("datetime64[D]").astype(np.int64)
+  lo, hi = np.nanmin(values), np.nanmax(values)
+  span_x = max(days[-1] - days[0], 1)
+  span_y = (hi - lo) or 1.0
+  x = PADDING + (days - days[0]) * ((WIDTH - 2 * PADDING) / span_x)
+  y = HEIGHT - PADDING - (values - lo) * ((HEIGHT - 2 * PADDING) / span_y)
+  svg = [
+    '<svg xmlns="http://www.w3.org/2000/svg" class="%s" viewBox="0 0 %d %d">' % (css_class, WIDTH, HEIGHT),
+    '<text x="%d" y="20" text-anchor="middle" font-size="14">%s</text>' % (WIDTH // 2, html.escape(title)),
+    '<text x="2" y="%d" font-size="10">%.2f</text>' % (PADDING, hi),
+    '<text x="2" y="%d" font-size="10">%.2f</text>' % (HEIGHT - PADDING, lo),
+    '<text x="%d" y="%d" font-size="10">%s</text>' % (PADDING, HEIGHT - 10, str(dates[0].astype("datetime64[D]"))),
+    '<text x="%d" y="%d" font-size="10" text-anchor="end">%s</text>' % (WIDTH - PADDING, HEIGHT - 10, str(dates[-1].astype("datetime64[D]")))
+  ]
+  for (label, color), row in zip(LINES, y):
+    svg.append('<polyline fill="none" stroke="%s" stroke-width="2" points="%s"><title>%s</title></polyline>' % (color, __points(x, row), label.capitalize()))
+  svg.append("</svg>")
+  return "".join(svg)
+
+
+def render_ticker_svgs(ticker: str, records: np.ndarray) -> List[str]:
+  """
+  Returns the 3month, 1month and 1week inline svg charts of a ticker, or an empty list when there are no prices
+
+  Parameters:
+  ticker: stock symbol
+  records: daily bars from the price store, see price_store.read_window
+  """
+  if not len(records):
+    return []
+  values = np.array([records[label] for label, _ in LINES], dtype=np.float64)
+  charts = []
+  for i, (suffix, days, title) in enumerate(CHART_WINDOWS):
+    start = 0 if days is None else -days
+    css_class = "Primary-line-graph" if i == 0 else "Line-graph"
+    charts.append(render_svg(records["date"][start:], values[:, start:], ticker + title, css_class))
+  return charts
@@ -0,0 +1,196 @@
+from . import settings
+import threading
+import hashlib
+import logging as log
+import pickle
+import json
+import os
+
+import yaml
+
+# libyaml's C parser is several times faster than the pure python one on large configs
+try:
+  from yaml import CSafeLoader as Loader
+except ImportError:
+  from yaml import SafeLoader as Loader
+
+
+class ConfigIndex:
+  """
+  Compiled client config, with the stock symbols of every client and the clients of every stock symbol
+  """
+
+  def __init__(self, sender: str, clients: dict, digest: str):
+    self.sender = sender
+    self.clients = clients
+    self.digest = digest
+    symbols = {}
+    for client, stocks in clients.items():
+      for s in stocks:
+        symbols.setdefault(s, []).append(client)
+    self.symbols = {s: tuple(c) for s, c in symbols.items()}
+
+  def stocks(self) -> list:
+    """
+    Returns the sorted stock symbols of every client
+    """
+    return sorted(self.symbols)
+
+  def clients_of(self, symbols) -> set:
+    """
+    Returns the clients following any of the stock symbols
+    """
+    clients = set()
+    for s in symbols:
+      clients.update(self.symbols.get(s, ()))
+    return clients
+
+
+def __index_path(config: str) -> str:
+  name = os.path.splitext(os.path.basename(config))[0]
+  key = hashlib.sha1(os.path.abspath(config).encode()).hexdigest()[:12]
+  return os.path.join(settings.CONFIG_INDEX_DIR, "%s-%s" % (name, key))
+
+
+def load(config: str) -> ConfigIndex:
+  """
+  Returns the index of a yaml config file. The compiled index is saved next to the response cache and reused
+  until the content of the config file changes, so unchanged configs are not parsed again
+
+  Parameters:
+  config: path to the yaml file with the sender and the email to stock symbol list mappings
+  """
+  with open(config, 'rb') as f:
+    data = f.read()
+  digest = hashlib.sha1(data).hexdigest()
+  path = __index_path(config) + ".index.pickle"
+  if os.path.exists(path):
+    try:
+      with open(path, 'rb') as f:
+        index = pickle.load(f)
+      if index.digest == digest:
+        log.info("Loaded compiled index of %d clients and %d stocks from %s", len(index.clients), len(index.symbols), path)
+        return index
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+      log.warning("Ignoring unreadable compiled config index %s", path)
+  parsed = yaml.load(data, Loader=Loader)
+  clients = {p["email"]: tuple(p["stocks"]) for p in parsed["mappings"]}
+  index = ConfigIndex(parsed["sender"], clients, digest)
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  tmp = path + ".tmp"
+  with open(tmp, 'wb') as f:
+    pickle.dump(index, f, pickle.HIGHEST_PROTOCOL)
+  os.replace(tmp, path)
+  log.info("Compiled index of %d clients and %d stocks to %s", len(clients), len(index.symbols), path)
+  return index
+
+
+class DeltaState:
+  """
+  Digests of the report sections and client reports delivered by the previous run of a config, used to skip
+  the reports whose stocks and stock data are the same as when they were last emailed.
+  A client's digest only changes with its stock symbols or the sections of its stocks
+  """
+
+  def __init__(self, path: str, index: ConfigIndex, sections=None, clients=None):
+    self.path = path
+    self.index = index
+    self.previous_sections = sections or {}
+    self.delivered = clients or {}
+    self.sections = {}
+    self.pending = {}
+    self.lock = threading.Lock()
+
+  def section_digest(self, symbol: str, section: str) -> str:
+    with self.lock:
+      digest = self.sections.get(symbol)
+    if digest is None:
+      digest = hashlib.sha1(section.encode()).hexdigest()
+      with self.lock:
+        self.sections[symbol] = digest
+    return digest
+
+  def is_current(self, client: str, sections: dict) -> bool:
+    """
+    Returns True when a client's report was emailed with the same stocks and sections, otherwise remembers the
+    digest of the new report so it is recorded once sent
+
+    Parameters:
+    client: client email
+    sections: dictionary of stock symbol to its html section
+    """
+    stocks = self.index.clients[client]
+    digest = hashlib.sha1("\0".join(s + ":" + self.section_digest(s, sections[s]) for s in stocks).encode()).hexdigest()
+    with self.lock:
+      previous = self.delivered.get(client)
+      if previous is not None and previous["digest"] == digest:
+        return True
+      self.pending[client] = digest
+      return False
+
+  def mark_sent(self, clients) -> None:
+    """
+    Records the reports of clients as delivered
+    """
+    with self.lock:
+      for client in clients:
+        # reports written by an earlier attempt of a resumed run have no digest and are compared again next run
+        digest = self.pending.pop(client, None)
+        if digest is not None:
+          self.delivered[client] = {"stocks": list(self.index.clients[client]), "digest": digest}
+
+  def config_diff(self) -> tuple:
+    """
+    Returns the clients added to, removed from and with changed stocks in the config since their last delivered report
+    """
+    with self.lock:
+      added = [c for c in self.index.clients if c not in self.delivered]
+      removed = [c for c in self.delivered if c not in self.index.clients]
+      changed = [c for c, e in self.delivered.items() if c in self.index.clients and tuple(e["stocks"]) != self.index.clients[c]]
+    return added, removed, changed
+
+  def changed_stocks(self) -> tuple:
+    """
+    Returns the stocks whose section changed since the previous run and the clients following them
+    """
+    with self.lock:
+      changed = [s for s, d in self.sections.items() if self.previous_sections.get(s) != d]
+    return changed, self.index.clients_of(changed)
+
+  def save(self) -> None:
+    with self.lock:
+      # clients removed from the config are dropped, stocks not rendered by this run keep their previous digest
+      sections = dict(self.previous_sections)
+      sections.update(self.sections)
+      data = json.dumps({"config": self.index.digest, "sections": sections,
+                         "clients": {c: e for c, e in self.delivered.items() if c in self.index.clients}},
+                        separators=(",", ":"), sort_keys=True)
+    tmp = self.path + ".tmp"
+    with open(tmp, 'w') as f:
+      f.write(data)
+    os.replace(tmp, self.path)
+
+
+def load_state(config: str, index: ConfigIndex, name=None) -> DeltaState:
+  """
+  Returns the delivery state of the previous run of a config
+
+  Parameters:
+  config: path to the yaml config file
+  index: index of the config, see load
+  name: optional state name, for runs of the same config that deliver different clients, e.g. client shards
+  """
+  path = __index_path(config) + ("-" + name if name else "") + ".state.json"
+  sections = clients = None
+  if os.path.exists(path):
+    with open(path, 'r') as f:
+      data = json.load(f)
+    sections = data["sections"]
+    clients = data["clients"]
+    log.info("Loaded the delivery state of %d clients from %s", len(clients), path)
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  state = DeltaState(path, index, sections, clients)
+  added, removed, changed = state.config_diff()
+  log.info("%d clients have no delivered report, %d were removed from the config and %d changed their stocks",
+           len(added), len(removed), len(changed))
+  return state
@@ -1,42 +1,47 @@
 import time
-import datetime
 import os
+import io
 import pathlib
+import functools
+import hashlib
 from .. import settings
 from progress.bar import Bar
-from google.cloud import storage
+from ..api import storage_api
+from . import report_templates
+
+
+__opening_tags = None
+
+
+def __get_opening_tags():
+  global __opening_tags
+  if __opening_tags is None:
+    path = os.path.join(str(pathlib.Path(__file__).parent.absolute()), "template.css")
+    with open(path, 'r') as file:
+      css_data = file.read().replace('\n', '')
+    __opening_tags = report_templates.OPENING.render(css=css_data)
+  return __opening_tags
+
+
+@functools.lru_cache(maxsize=4096)
+def __format_publish_time(timestamp):
+  return time.strftime('%m-%d-%Y', time.localtime(timestamp))
 
 
 def __add_opening_tags(f, output_dir):
-  path = os.path.join(str(pathlib.Path(__file__).parent.absolute()), "template.css")
-  with open(path, 'r') as file:
-    css_data = file.read().replace('\n', '')
-  file.close()
-  html = [
-      """<!DOCTYPE html><head>""",
-      "<style>"
-  ]
-  html.append(css_data)
-  html.append("""</style></head><body><div>""")
-  f.write(''.join(html))
+  f.write(__get_opening_tags())
 
 
 def __add_closing_tags(f):
-  html = """</div></body></html>"""
-  f.write(html)
+  f.write(report_templates.CLOSING)
 
 
 def __add_section_break(f):
-  html = """<div class="Line-break"></div>"""
-  f.write(html)
+  f.write(report_templates.SECTION_BREAK)
 
 
 def __add_header(f, client):
-  html = [
-    """<div class="Header">""","""<p class="Name">""",
-    "Report for " + client, "</p></div>"
-  ]
-  f.write(''.join(html))
+  f.write(report_templates.HEADER.render(client=client))
 
 
 def __add_intro(f, stock, name, quote, sentiment):
@@ -45,104 +50,116 @@ def __add_intro(f, stock, name, quote, sentiment):
     sent_style = "Def-sentiment-value"
   elif sentiment < 0:
     sent_style = "Neg-sentiment-value"
-  html = [
-      """<div class="Intro-container">""",
-      """<h2 class="Stock-name">""",
-      stock + "(" + name + ")",
-      "</h2>",
-      """<div class="Quote-info-container">""",
-      """<p class="Quote-info">""", "Open: " + str(quote["o"]), "</p>",
-      """<p class="Quote-info">""", "Close: " + str(quote["c"]), "</p>",
-      """<p class="Quote-info">""", "High: " + str(quote["h"]), "</p>"
-      """<p class="Quote-info">""", "Low: " + str(quote["l"]), "</p>",
-      """</div>""",
-      """<p class="Sentiment">""","Sentiment: ",
-      """<span class=""", '"' + sent_style + '">', 
-      str(sentiment), "</span></p></div>"
-  ]
-  f.write(''.join(html))
+  f.write(report_templates.INTRO.render(
+    stock=stock, name=name,
+    open=quote.text("o"), close=quote.text("c"), high=quote.text("h"), low=quote.text("l"),
+    sent_style=sent_style, sentiment=str(sentiment)
+  ))
 
 
 def __add_news(f, news):
-  html = [
-    """<div class="News-container">""",
-    """<h2 class="Company-news-header">Company News</h2>""",
-    """<div class="News-article-1">"""    
-  ]
+  html = [report_templates.NEWS_OPENING]
   i = 0
-  while i < 5 and i < len(news): 
+  while i < 5 and i < len(news):
     if i == 0:
-      html.extend([
-          "<a href=",'"' + news[i]["url"] + '"', """ target="_blank" rel="noopener noreferrer">""",
-          """<img src=""", '"' + news[i]["image"] + '"', """ class="Article-img">""",
-          """<div class="Article-description">""",
-          """<p class="Headline">""", news[i]["headline"], "</p>",
-          """<p class="Source">""", news[i]["source"], "</p>",
-          """<p class="Publish-time">""", time.strftime('%m-%d-%Y', time.localtime(news[i]["datetime"])), "</p>",
-          """</div></a></div><div class="Sub-news-articles">"""
-      ])
+      template = report_templates.MAIN_ARTICLE
+    elif i % 2 != 0:
+      template = report_templates.GROUP_FIRST_ARTICLE
     else:
-      if i % 2 != 0:
-        html.extend([
-          """<div class="Sub-article-group">""",
-         """<div class="Sub-article">""",
-          "<a href=", '"' + news[i]["url"] + '"', """ target="_blank" rel="noopener noreferrer">""",
-          """<img src=""", '"' + news[i]["image"] + '"', """ class="Article-img">""",
-          """<div class="Article-description">""",
-          """<p class="Sub-Headline">""", news[i]["headline"], "</p>",
-          """<p class="Sub-Source">""", news[i]["source"], "</p>",
-          """<p class="Sub-publish-time">""", time.strftime('%m-%d-%Y', time.localtime(news[i]["datetime"])), "</p>",
-          "</div></a></div>"
-        ])
-      else:
-        html.extend([
-            """<div class="Sub-article">""",
-            "<a href=", '"' + news[i]["url"] + '"', """ target="_blank" rel="noopener noreferrer">""",
-            """<img src=""", '"' + news[i]["image"] + '"', """ class="Article-img">""",
-            """<div class="Article-description">""",
-            """<p class="Sub-Headline">""", news[i]["headline"], "</p>",
-            """<p class="Sub-Source">""", news[i]["source"], "</p>",
-            """<p class="Sub-publish-time">""", time.strftime('%m-%d-%Y', time.localtime(news[i]["datetime"])), "</p>",
-            "</div></a></div></div>"
-      ])
+      template = report_templates.GROUP_SECOND_ARTICLE
+    article = news[i]
+    html.append(template.render(
+      url=article.url, image=article.image, headline=article.headline,
+      source=article.source, published=__format_publish_time(article.datetime)
+    ))
     i+=1
   if i < 6 and (len(news)-1) % 2 != 0:
     html.append("</div>")
-  html.append("""</div></div>""")
+  html.append(report_templates.NEWS_CLOSING)
   f.write(''.join(html))
 
 
-def __add_graphs(f, stock, gcp_path):
-  date = datetime.datetime.today().strftime("%Y%m%d")
-  storage_client = storage.Client()
-  bucket = storage_client.bucket(settings.GCP_BUCKET)
-
-  html = [
-      """<div class="Graph-container">""",
-      """<img src=""", '"' + bucket.blob(date + "/" + stock+"_3mo.png").public_url + '"', """ class="Primary-line-graph" />""",
-      """<div class="Sub-graph-container">""",
-      """<img src=""", '"' + bucket.blob(date + "/" + stock+"_1mo.png").public_url + '"', """ class="Line-graph" />""",
-      """<img src=""", '"' + bucket.blob(date + "/" + stock+"_1wk.png").public_url + '"', """ class="Line-graph" />""",
-      "</div></div>"
-  ]
+def __add_inline_graphs(f, svgs):
+  html = ["""<div class="Graph-container">"""]
+  if svgs:
+    html.extend([svgs[0], """<div class="Sub-graph-container">"""])
+    html.extend(svgs[1:])
+    html.append("</div>")
+  html.append("</div>")
   f.write(''.join(html))
-  
 
-def create_report(stocks, output_dir, client, profiles, news, quotes, sentiment_scores) -> None:
-  file = os.path.join(output_dir,"reports",client + "_report.html")
-  f = open(file, 'w')
+
+def __add_graphs(f, stock, gcp_path):
+  f.write(report_templates.GRAPHS.render(
+    three_months=storage_api.public_url(stock+"_3mo.png"),
+    one_month=storage_api.public_url(stock+"_1mo.png"),
+    one_week=storage_api.public_url(stock+"_1wk.png")
+  ))
+
+
+def render_stock_section(stock, profile, quote, sentiment, company_news, charts=None) -> str:
+  """
+  Returns the html section of a stock, shared by the reports of every client holding the stock
+
+  Parameters:
+  stock: stock symbol
+  profile: records.Profile of the stock
+  quote: records.Quote of the stock
+  sentiment: sentiment score of the stock, or "N/A"
+  company_news: list of records.NewsArticle of the stock
+  charts: inline svg charts of the stock. Charts are linked from the GCP bucket when not given
+  """
+  f = io.StringIO()
+  gcp_path = ''.join(["https://storage.cloud.google.com/",settings.GCP_BUCKET,"/",time.strftime("%Y%m%d"),"/"])
+  __add_intro(f, stock, profile.name, quote, sentiment)
+  __add_news(f, company_news)
+  if charts is None:
+    __add_graphs(f, stock, gcp_path)
+  else:
+    __add_inline_graphs(f, charts)
+  __add_section_break(f)
+  return f.getvalue()
+
+
+def render_sections(stocks, profiles, news, quotes, sentiment_scores, charts=None) -> dict:
+  """
+  Returns a dictionary of stock symbol to its html section
+
+  Parameters:
+  stocks: list of stock symbols
+  profiles, news, quotes, sentiment_scores: dictionaries of stock symbol to its data
+  charts: dictionary of stock symbol to its inline svg charts. Charts are linked from the GCP bucket when not given
+  """
+  sections = {}
+  for stock in stocks:
+    stock_charts = None if charts is None else charts.get(stock, [])
+    sections[stock] = render_stock_section(stock, profiles[stock], quotes[stock], sentiment_scores[stock], news[stock], stock_charts)
+  return sections
+
+
+def write_report(stocks, output_dir, client, sections, manifest=None) -> str:
+  """
+  Writes the html report of a client assembled from prerendered stock sections and returns its path
+
+  Parameters:
+  stocks: list of stock symbols of the client
+  output_dir: path to the temporary directory
+  client: client email
+  sections: dictionary of stock symbol to its html section, see render_sections
+  manifest: optional report_manifest.ReportManifest the report is recorded in
+  """
+  f = io.StringIO()
   __add_opening_tags(f, output_dir)
   __add_header(f, client)
-  
   for stock in stocks:
-    profile = profiles[stock]
-    quote = quotes[stock]
-    sentiment = sentiment_scores[stock]
-    company_news = news[stock]
-    gcp_path = ''.join(["https://storage.cloud.google.com/",settings.GCP_BUCKET,"/",time.strftime("%Y%m%d"),"/"])
-    __add_intro(f, stock, profile["name"], quote, sentiment)
-    __add_news(f, company_news)
-    __add_graphs(f, stock, gcp_path)
-    __add_section_break(f)
+    f.write(sections[stock])
   __add_closing_tags(f)
-  f.close()
+  file = os.path.join(output_dir,"reports",client + "_report.html")
+  html = f.getvalue()
+  with open(file, 'w') as report:
+    report.write(html)
+    encoding = report.encoding
+  if manifest is not None:
+    data = html.encode(encoding)
+    manifest.add(client, file, len(data), hashlib.sha1(data).hexdigest())
+  return file
@@ -0,0 +1,81 @@
+import threading
+import logging as log
+import json
+import os
+
+MANIFEST_NAME = "manifest.json"
+
+
+class ReportManifest:
+  """
+  Index of client email to its report path, size, sha1 hash and the id of the message it was emailed with.
+  Saved as json next to the reports so the mailer looks reports up directly and an interrupted email run can resume
+  """
+
+  def __init__(self, path: str, entries=None):
+    self.path = path
+    self.entries = entries or {}
+    self.lock = threading.Lock()
+
+  def add(self, client: str, path: str, size: int, digest: str) -> None:
+    """
+    Records a written report. A report whose content changed since it was emailed is marked as not sent
+    """
+    with self.lock:
+      previous = self.entries.get(client)
+      sent = previous["sent"] if previous is not None and previous["hash"] == digest else None
+      self.entries[client] = {"path": path, "size": size, "hash": digest, "sent": sent}
+
+  def get(self, client: str):
+    """
+    Returns the entry of a client's report, or None if the client has no report
+    """
+    with self.lock:
+      return self.entries.get(client)
+
+  def is_sent(self, client: str) -> bool:
+    with self.lock:
+      entry = self.entries.get(client)
+      return entry is not None and entry["sent"] is not None
+
+  def mark_sent(self, message_ids: dict) -> None:
+    """
+    Records the message ids of emailed reports
+
+    Parameters:
+    message_ids: dictionary of client email to message id
+    """
+    with self.lock:
+      for client, message_id in message_ids.items():
+        self.entries[client]["sent"] = message_id
+
+  def unsent(self) -> list:
+    """
+    Returns the clients whose report has not been emailed yet
+    """
+    with self.lock:
+      return [client for client, entry in self.entries.items() if entry["sent"] is None]
+
+  def save(self) -> None:
+    with self.lock:
+      data = json.dumps(self.entries, indent=1, sort_keys=True)
+    tmp = self.path + ".tmp"
+    with open(tmp, 'w') as f:
+      f.write(data)
+    os.replace(tmp, self.path)
+
+
+def load(reports_dir: str) -> ReportManifest:
+  """
+  Returns the manifest of a reports directory, empty when none was saved yet
+
+  Parameters:
+  reports_dir: directory of the ${client}_report.html reports
+  """
+  path = os.path.join(reports_dir, MANIFEST_NAME)
+  entries = None
+  if os.path.exists(path):
+    with open(path, 'r') as f:
+      entries = json.load(f)
+    log.info("Loaded report manifest of %d reports from %s", len(entries), path)
+  return ReportManifest(path, entries)
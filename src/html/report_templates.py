@@ -0,0 +1,58 @@
+import re
+import sys
+
+SLOT = re.compile(r"\$(\w+)")
+
+
+class Template:
+  """
+  Html fragment with $name slots, compiled once into interned static fragments and a format string
+  so rendering only fills the fixed slots
+  """
+
+  def __init__(self, source: str):
+    parts = SLOT.split(source)
+    self.statics = [sys.intern(p) for p in parts[0::2]]
+    self.slots = parts[1::2]
+    fmt = [self.statics[0].replace("{", "{{").replace("}", "}}")]
+    for slot, static in zip(self.slots, self.statics[1:]):
+      fmt.append("{" + slot + "}")
+      fmt.append(static.replace("{", "{{").replace("}", "}}"))
+    self.format = sys.intern("".join(fmt)).format
+
+  def render(self, **values) -> str:
+    return self.format(**values)
+
+
+OPENING = Template("""<!DOCTYPE html><head><style>$css</style></head><body><div>""")
+CLOSING = """</div></body></html>"""
+SECTION_BREAK = """<div class="Line-break"></div>"""
+HEADER = Template("""<div class="Header"><p class="Name">Report for $client</p></div>""")
+INTRO = Template(
+  """<div class="Intro-container"><h2 class="Stock-name">$stock($name)</h2>"""
+  """<div class="Quote-info-container">"""
+  """<p class="Quote-info">Open: $open</p><p class="Quote-info">Close: $close</p>"""
+  """<p class="Quote-info">High: $high</p><p class="Quote-info">Low: $low</p></div>"""
+  """<p class="Sentiment">Sentiment: <span class="$sent_style">$sentiment</span></p></div>"""
+)
+NEWS_OPENING = """<div class="News-container"><h2 class="Company-news-header">Company News</h2><div class="News-article-1">"""
+NEWS_CLOSING = """</div></div>"""
+__ARTICLE_LINK = """<a href="$url" target="_blank" rel="noopener noreferrer"><img src="$image" class="Article-img"><div class="Article-description">"""
+MAIN_ARTICLE = Template(
+  __ARTICLE_LINK +
+  """<p class="Headline">$headline</p><p class="Source">$source</p><p class="Publish-time">$published</p>"""
+  """</div></a></div><div class="Sub-news-articles">"""
+)
+__SUB_ARTICLE = (
+  """<div class="Sub-article">""" + __ARTICLE_LINK +
+  """<p class="Sub-Headline">$headline</p><p class="Sub-Source">$source</p><p class="Sub-publish-time">$published</p>"""
+  """</div></a></div>"""
+)
+# sub articles are laid out in groups of two
+GROUP_FIRST_ARTICLE = Template("""<div class="Sub-article-group">""" + __SUB_ARTICLE)
+GROUP_SECOND_ARTICLE = Template(__SUB_ARTICLE + "</div>")
+GRAPHS = Template(
+  """<div class="Graph-container"><img src="$three_months" class="Primary-line-graph" />"""
+  """<div class="Sub-graph-container"><img src="$one_month" class="Line-graph" />"""
+  """<img src="$one_week" class="Line-graph" /></div></div>"""
+)
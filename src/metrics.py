@@ -0,0 +1,262 @@
+from contextlib import contextmanager
+import threading
+import tracemalloc
+import cProfile
+import pstats
+import bisect
+import time
+import json
+import os
+import logging as log
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+__lock = threading.Lock()
+__counters = {}
+__gauges = {}
+__histograms = {}
+__stage_spans = {}
+__profile_dir = None
+__profiles = {}
+__thread = threading.local()
+
+
+def __key(name: str, labels: dict) -> tuple:
+  return name, tuple(sorted(labels.items()))
+
+
+def inc(name: str, value=1, **labels) -> None:
+  """
+  Adds to a counter, e.g. inc("api_requests_total", provider="finnhub", status="200")
+  """
+  key = __key(name, labels)
+  with __lock:
+    __counters[key] = __counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value, **labels) -> None:
+  """
+  Sets a gauge to a value
+  """
+  with __lock:
+    __gauges[__key(name, labels)] = value
+
+
+def observe(name: str, value: float, **labels) -> None:
+  """
+  Adds an observation to a histogram with LATENCY_BUCKETS buckets
+  """
+  key = __key(name, labels)
+  with __lock:
+    h = __histograms.get(key)
+    if h is None:
+      h = __histograms[key] = {"buckets": [0] * (len(LATENCY_BUCKETS) + 1), "sum": 0.0, "count": 0}
+    h["buckets"][bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+    h["sum"] += value
+    h["count"] += 1
+
+
+@contextmanager
+def timer(name: str, **labels):
+  """
+  Observes the wall time of a block in the histogram `name`
+  """
+  start = time.perf_counter()
+  try:
+    yield
+  finally:
+    observe(name, time.perf_counter() - start, **labels)
+
+
+def __span(stage: str, start: float, end: float) -> None:
+  with __lock:
+    first, last = __stage_spans.get(stage, (start, end))
+    __stage_spans[stage] = (min(first, start), max(last, end))
+
+
+def enable_profiling(directory: str) -> None:
+  """
+  Profiles every stage with cProfile and the sequential stages with tracemalloc, see save_profiles
+
+  Parameters:
+  directory: directory the profiles are written to
+  """
+  global __profile_dir
+  os.makedirs(directory, exist_ok=True)
+  __profile_dir = directory
+  tracemalloc.start(10)
+  log.info("Profiling stages to %s", directory)
+
+
+@contextmanager
+def __profiled(stage: str):
+  # cProfile only follows the thread that enables it, so every thread keeps its own profile of a stage
+  if __profile_dir is None or getattr(__thread, "profiling", False):
+    yield
+    return
+  profiles = getattr(__thread, "profiles", None)
+  if profiles is None:
+    profiles = __thread.profiles = {}
+  profile = profiles.get(stage)
+  if profile is None:
+    profile = profiles[stage] = cProfile.Profile()
+    with __lock:
+      __profiles.setdefault(stage, []).append(profile)
+  __thread.profiling = True
+  try:
+    profile.enable()
+  except ValueError:
+    # another profiler is already active in this process
+    __thread.profiling = False
+    yield
+    return
+  try:
+    yield
+  finally:
+    profile.disable()
+    __thread.profiling = False
+
+
+@contextmanager
+def stage(name: str):
+  """
+  Records the wall time of a sequential stage of a run in the gauge stage_seconds. When profiling is enabled the stage
+  is profiled and the memory it allocated is written to ${profile dir}/${name}.tracemalloc.txt.
+  Can also be used as a function decorator
+  """
+  before = tracemalloc.take_snapshot() if __profile_dir is not None else None
+  start = time.perf_counter()
+  try:
+    with __profiled(name):
+      yield
+  finally:
+    __span(name, start, time.perf_counter())
+    if before is not None:
+      stats = tracemalloc.take_snapshot().compare_to(before, "lineno")
+      with open(os.path.join(__profile_dir, name + ".tracemalloc.txt"), 'w') as f:
+        f.write("Top memory allocations of stage %s\n" % name)
+        for stat in stats[:25]:
+          f.write(str(stat) + "\n")
+
+
+def timed(stage_name: str, fn):
+  """
+  Wraps a task function of a stage to observe the duration of every call in the task_seconds histogram.
+  The stage_seconds gauge of the stage is the wall time from its first task starting to its last task finishing
+
+  Parameters:
+  stage_name: name of the stage the task belongs to
+  fn: task function
+  """
+  def call(*args):
+    start = time.perf_counter()
+    try:
+      with __profiled(stage_name):
+        return fn(*args)
+    finally:
+      end = time.perf_counter()
+      observe("task_seconds", end - start, stage=stage_name)
+      __span(stage_name, start, end)
+  return call
+
+
+def save_profiles() -> None:
+  """
+  Writes the merged cProfile stats of every stage to ${profile dir}/${stage}.prof
+  """
+  if __profile_dir is None:
+    return
+  with __lock:
+    profiles = {s: list(p) for s, p in __profiles.items()}
+  for stage_name, stage_profiles in profiles.items():
+    stats = None
+    for profile in stage_profiles:
+      try:
+        if stats is None:
+          stats = pstats.Stats(profile)
+        else:
+          stats.add(profile)
+      except TypeError:
+        # the profile never ran a call
+        continue
+    if stats is not None:
+      stats.dump_stats(os.path.join(__profile_dir, stage_name + ".prof"))
+  log.info("Saved profiles of %d stages to %s", len(profiles), __profile_dir)
+
+
+def snapshot() -> dict:
+  """
+  Returns every counter, gauge and histogram as a json serializable dictionary
+  """
+  def labeled(key, value):
+    return {"name": key[0], "labels": dict(key[1]), "value": value}
+
+  with __lock:
+    for stage_name, (first, last) in __stage_spans.items():
+      __gauges[__key("stage_seconds", {"stage": stage_name})] = last - first
+    return {
+      "counters": [labeled(k, v) for k, v in sorted(__counters.items())],
+      "gauges": [labeled(k, v) for k, v in sorted(__gauges.items())],
+      "histograms": [labeled(k, {"buckets": dict(zip([str(b) for b in LATENCY_BUCKETS] + ["+Inf"], h["buckets"])),
+                                 "sum": h["sum"], "count": h["count"]}) for k, h in sorted(__histograms.items())]
+    }
+
+
+def __labels(labels: dict, extra=None) -> str:
+  items = list(labels.items()) + (extra or [])
+  if not items:
+    return ""
+  return "{" + ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in items) + "}"
+
+
+def to_prometheus(data=None) -> str:
+  """
+  Returns the metrics in the Prometheus text exposition format
+
+  Parameters:
+  data: metrics returned by snapshot. default is the current metrics
+  """
+  data = data or snapshot()
+  lines = []
+  typed = set()
+
+  def declare(name, kind):
+    if name not in typed:
+      typed.add(name)
+      lines.append("# TYPE %s %s" % (name, kind))
+
+  for m in data["counters"]:
+    declare(m["name"], "counter")
+    lines.append("%s%s %s" % (m["name"], __labels(m["labels"]), repr(float(m["value"]))))
+  for m in data["gauges"]:
+    declare(m["name"], "gauge")
+    lines.append("%s%s %s" % (m["name"], __labels(m["labels"]), repr(float(m["value"]))))
+  for m in data["histograms"]:
+    declare(m["name"], "histogram")
+    total = 0
+    for bound, count in m["value"]["buckets"].items():
+      total += count
+      lines.append("%s_bucket%s %d" % (m["name"], __labels(m["labels"], [("le", bound)]), total))
+    lines.append("%s_sum%s %s" % (m["name"], __labels(m["labels"]), repr(float(m["value"]["sum"]))))
+    lines.append("%s_count%s %d" % (m["name"], __labels(m["labels"]), m["value"]["count"]))
+  return "\n".join(lines) + "\n"
+
+
+def write(directory: str, name: str) -> str:
+  """
+  Writes the metrics to ${directory}/${name}.json and ${directory}/${name}.prom and returns the path of the json file
+
+  Parameters:
+  directory: metrics directory
+  name: file name of the run without extension
+  """
+  os.makedirs(directory, exist_ok=True)
+  data = snapshot()
+  path = os.path.join(directory, name + ".json")
+  with open(path, 'w') as f:
+    json.dump(data, f, indent=1)
+  with open(os.path.join(directory, name + ".prom"), 'w') as f:
+    f.write(to_prometheus(data))
+  log.info("Wrote run metrics to %s", path)
+  return path
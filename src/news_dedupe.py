@@ -0,0 +1,134 @@
+from . import settings
+from . import metrics
+import numpy as np
+import hashlib
+import re
+import logging as log
+
+# Cross-ticker deduplication of a run's company news, used when settings.NEWS_DEDUPE is enabled.
+# The same wire story is often returned for many symbols with small edits, so every article is fingerprinted
+# with a MinHash signature of the word 3-grams of its headline and summary, and near-duplicates are found
+# through a banded LSH index:
+#
+#   article ─> shingles ─> MinHash signature ─> LSH bands ─> candidate stories ─> estimated jaccard >= threshold
+#
+# Articles are visited from the earliest published, so the first article of a story is its canonical article.
+# Every copy of a story is replaced by the canonical article, a stock lists each story once and its sentiment is
+# the mean over its stories, each story scored once for the whole run.
+
+RE_WORD = re.compile(r"[a-z0-9]+")
+SHINGLE_SIZE = 3
+# fixed seeds keep the signatures, and so the stories, the same in every process and run
+__SEEDS = np.random.RandomState(1).randint(0, np.iinfo(np.int64).max, size=settings.NEWS_DEDUPE_PERMUTATIONS,
+                                           dtype=np.int64).astype(np.uint64)
+
+
+def __mix(z):
+  # splitmix64 finalizer, a different random permutation of 64 bit hashes for every seed. uint64 arithmetic wraps
+  z = (z ^ (z >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+  z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+  return z ^ (z >> np.uint64(31))
+
+
+def signature(text: str):
+  """
+  Returns the MinHash signature of the word 3-grams of a text, or None when the text has no words
+
+  Parameters:
+  text: text to fingerprint
+  """
+  words = RE_WORD.findall(text.lower())
+  if not words:
+    return None
+  shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+  hashes = np.fromiter((int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little") for s in shingles),
+                       dtype=np.uint64, count=len(shingles))
+  return __mix(hashes[:, None] ^ __SEEDS).min(axis=0)
+
+
+def similarity(a, b) -> float:
+  """
+  Returns the jaccard similarity of two texts estimated from their signatures
+  """
+  return float(np.count_nonzero(a == b)) / len(a)
+
+
+class LSHIndex:
+  """
+  Banded locality sensitive hashing index of MinHash signatures. Signatures that agree on every row of any band
+  share a bucket, so similar signatures are found without comparing every pair
+  """
+
+  def __init__(self, bands: int):
+    self.bands = bands
+    self.buckets = [{} for _ in range(bands)]
+
+  def __band_keys(self, sig) -> list:
+    rows = len(sig) // self.bands
+    return [sig[b * rows:(b + 1) * rows].tobytes() for b in range(self.bands)]
+
+  def add(self, key, sig) -> None:
+    for bucket, band in zip(self.buckets, self.__band_keys(sig)):
+      bucket.setdefault(band, []).append(key)
+
+  def candidates(self, sig) -> list:
+    """
+    Returns the keys that share a bucket with a signature, in the order they were added
+    """
+    found = {}
+    for bucket, band in zip(self.buckets, self.__band_keys(sig)):
+      for key in bucket.get(band, ()):
+        found[key] = True
+    return list(found)
+
+
+class DedupedNews:
+  """
+  The company news of a run with every story listed once per stock, see find_stories, and the sentiment of every stock
+  """
+  __slots__ = ("articles", "sentiment")
+
+  def __init__(self, articles: dict, sentiment: dict):
+    self.articles = articles
+    self.sentiment = sentiment
+
+
+def find_stories(company_news: dict) -> dict:
+  """
+  Returns a dictionary of stock symbol to its list of canonical articles, one per story in order of its first
+  article in the stock's news
+
+  Parameters:
+  company_news: dictionary of stock symbol to list of records.NewsArticle
+  """
+  index = LSHIndex(settings.NEWS_DEDUPE_BANDS)
+  canonical = []
+  signatures = []
+  story_of = {}
+  order = sorted(((a.datetime or 0, s, i) for s in company_news for i, a in enumerate(company_news[s])))
+  for _, s, i in order:
+    article = company_news[s][i]
+    sig = signature((article.headline or "") + " " + (article.summary or ""))
+    story = None
+    if sig is not None:
+      for candidate in index.candidates(sig):
+        if similarity(sig, signatures[candidate]) >= settings.NEWS_DEDUPE_THRESHOLD:
+          story = candidate
+          break
+    if story is None:
+      story = len(canonical)
+      canonical.append(article)
+      signatures.append(sig)
+      if sig is not None:
+        index.add(story, sig)
+    story_of[(s, i)] = story
+  stories = {}
+  for s in company_news:
+    seen = dict.fromkeys(story_of[(s, i)] for i in range(len(company_news[s])))
+    stories[s] = [canonical[story] for story in seen]
+  total = sum(len(n) for n in company_news.values())
+  log.info("Found %d stories in %d articles of %d stocks, %d articles are copies of another stock's or the same stock's story",
+           len(canonical), total, len(company_news), total - len(canonical))
+  metrics.set_gauge("news_stories", len(canonical))
+  metrics.set_gauge("news_duplicates", total - len(canonical))
+  return stories
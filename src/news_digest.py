@@ -0,0 +1,100 @@
+from . import settings
+from .api import finnhub_api
+from .api import rate_limiter
+from .api import response_cache
+from .sentiment import sentiment_analysis
+from .records import NewsDigest, NewsArticle
+import requests
+import heapq
+import time
+import logging as log
+
+# Streaming news ingestion, used when settings.NEWS_INGESTION is "stream". A noisy stock can have hundreds of
+# articles a day while the reports show only a few, so articles are consumed as the response is parsed:
+#
+#   response chunks ─> articles ─┬─> bounded heap of the NEWS_TOP_N most recent articles ─> report section
+#                                └─> sentiment scored in batches, kept as a running total and count
+#
+# Memory then depends on NEWS_TOP_N and the batch size instead of on the number of articles, and the sentiment is
+# the same mean over the summary and headline of every article as the full ingestion.
+
+
+def build(articles, top_n: int) -> NewsDigest:
+  """
+  Returns the digest of a stream of articles. The articles themselves are not changed
+
+  Parameters:
+  articles: iterable of records.NewsArticle
+  top_n: number of most recent articles kept
+  """
+  heap = []
+  texts = []
+  total = 0.0
+  count = 0
+
+  def score(batch):
+    nonlocal total, count
+    scores = sentiment_analysis.get_sentiments(batch)
+    # added in article order so the mean is the same as when every text is scored at once
+    for text in batch:
+      total += scores[text]
+    count += len(batch)
+
+  for seq, article in enumerate(articles):
+    texts.append(article.summary)
+    texts.append(article.headline)
+    if len(texts) >= settings.SENTIMENT_BATCH_SIZE:
+      score(texts)
+      texts = []
+    # the earlier of two articles published at the same time is kept, as in the response order
+    key = (article.datetime or 0, -seq)
+    if len(heap) < top_n or key > heap[0][:2]:
+      # summaries are only needed for the sentiment, so kept articles are copies without them
+      kept = NewsArticle(article.headline, None, article.url, article.image, article.source, article.datetime)
+      if len(heap) < top_n:
+        heapq.heappush(heap, key + (kept,))
+      else:
+        heapq.heapreplace(heap, key + (kept,))
+  if texts:
+    score(texts)
+  articles = [entry[2] for entry in sorted(heap, key=lambda e: e[:2], reverse=True)]
+  return NewsDigest(articles, total, count)
+
+
+def get_company_news_digest(s: str, start: str, end: str) -> NewsDigest:
+  """
+  Returns the digest of a stock's company news in a date window, streamed from finnhub and cached like the news
+
+  Parameters:
+  s: stock symbol
+  start: start date in format YYYY-MM-DD
+  end: end date in format YYYY-MM-DD
+  """
+  top_n = settings.NEWS_TOP_N
+  # the sentiment aggregate depends on the backend that scored it
+  key = "digest:%s:%s:%s:%d:%s" % (s.upper(), start, end, top_n, settings.SENTIMENT_BACKEND)
+  cached = response_cache.get("news", key)
+  if cached is not None:
+    return NewsDigest.from_json(cached)
+  for attempt in range(settings.MAX_RETRIES + 1):
+    r = finnhub_api.stream_company_news(s, start, end)
+    if r is None:
+      # failed requests are logged by the rate limiter and, like the full ingestion, leave the stock without news
+      return NewsDigest([], 0.0, 0)
+    try:
+      with r:
+        digest = build(finnhub_api.iter_articles(r), top_n)
+      break
+    except ValueError as e:
+      log.error("Could not parse the news of %s: %s", s, str(e))
+      return NewsDigest([], 0.0, 0)
+    except requests.exceptions.RequestException as e:
+      # the connection dropped while the response was read, the digest is built again from a new request
+      if attempt == settings.MAX_RETRIES:
+        raise
+      delay = rate_limiter.get_backoff(attempt)
+      log.warning("Reading the news of %s failed with %s, retrying in %.2fs (attempt %d)", s, e, delay, attempt + 1)
+      time.sleep(delay)
+  log.debug("Kept %d articles of %s with %d scored texts", len(digest.articles), s, digest.count)
+  response_cache.put("news", key, digest.to_json())
+  return digest
@@ -0,0 +1,306 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from progress.bar import Bar
+import multiprocessing
+import contextlib
+import logging as log
+import os
+from . import settings
+from . import util_functions
+from .scheduler import Scheduler
+from .api import finnhub_api
+from .api import yfinance_api
+from .api import price_store
+from .api import storage_api
+from .api import gmail_api
+from .charts import svg_charts
+from .sentiment import sentiment_analysis
+from .html import report_maker
+from .html import report_manifest
+from . import run_journal
+from . import metrics
+from . import records
+from . import news_digest
+from . import news_dedupe
+
+# Tasks whose results are kept in the run journal, so a resumed run skips them and everything only they depend on.
+# Sending is not journaled, as some emails of a finished send may have failed. The report manifest records every sent
+# email instead, so a resumed run only sends the emails that were not sent
+JOURNALED_TASKS = frozenset(("profile", "quote", "news", "sentiment", "chart", "section", "report"))
+
+# Every stock is a chain of tasks instead of a stage over all stocks, e.g. the sentiment of AAPL is
+# scored while the news of MSFT is still downloading, and a client's report is written as soon as
+# the sections of its stocks are rendered:
+#
+#   profile ─────────────────────────┐
+#   quote ───────────────────────────┤
+#   news ─────┬──────────────────────┼─> section ─> report (per client) ─> message (per client) ─> send (all clients)
+#             └─> sentiment ─────────┤
+#   prices (all stocks) ─> chart(s) ─┘
+#
+# The sentiment tasks share a sentiment_analysis.ScoreMemo, so a text published for several stocks is scored once
+
+
+def __quote(quotes, s) -> records.Quote:
+  return quotes.set(s, finnhub_api.get_stock_quote(s))
+
+
+def __sentiment(s, memo, news) -> float:
+  return util_functions.get_sentiment_scores({s: news}, memo)[s]
+
+
+def __digest_sentiment(digest):
+  return digest.sentiment()
+
+
+def __dedupe(stocks, *news) -> news_dedupe.DedupedNews:
+  stories = news_dedupe.find_stories(dict(zip(stocks, news)))
+  # every story is scored once, however many stocks it was published for
+  return news_dedupe.DedupedNews(stories, util_functions.get_sentiment_scores(stories))
+
+
+def __story_sentiment(s, deduped):
+  return deduped.sentiment[s]
+
+
+def __svg_chart(s, _prices) -> dict:
+  records = price_store.read_window(s, settings.PRICE_HISTORY_DAYS)
+  with metrics.timer("chart_render_seconds", format="svg"):
+    return svg_charts.render_ticker_svgs(s, records)
+
+
+def __png_chart_job(s, path, _prices) -> tuple:
+  from .charts import png_charts
+  return png_charts.chart_job(s, yfinance_api.get_stored_prices(s), path)
+
+
+def __upload(uploader, rendered) -> int:
+  # rendering processes have their own metrics, so render times are observed here
+  metrics.observe("chart_render_seconds", rendered[2], format="png")
+  return uploader.upload(rendered[1])
+
+
+def __section(s, inline_charts, profile, quote, sentiment, news, charts) -> str:
+  if isinstance(news, records.NewsDigest):
+    news = news.articles
+  elif isinstance(news, news_dedupe.DedupedNews):
+    news = news.articles[s]
+  return report_maker.render_stock_section(s, profile, quote, sentiment, news, charts if inline_charts else None)
+
+
+def __report(client, stocks, output_dir, manifest, state, *sections):
+  sections = dict(zip(stocks, sections))
+  # reports emailed by an earlier run with the same stocks and sections are not written or sent again
+  if state is not None and state.is_current(client, sections):
+    return None
+  report_maker.write_report(stocks, output_dir, client, sections, manifest)
+  entry = manifest.get(client)
+  return {"path": entry["path"], "size": entry["size"], "hash": entry["hash"]}
+
+
+def __message(sender, client, manifest, report):
+  # reports emailed by an earlier attempt of the run are not sent again
+  if report is None or manifest.is_sent(client):
+    return None
+  return gmail_api.create_message(sender, client, report["path"])
+
+
+def __send(sender, clients, manifest, state, *messages) -> dict:
+  manifest.save()
+
+  def on_sent(message_ids):
+    manifest.mark_sent(message_ids)
+    manifest.save()
+    if state is not None:
+      state.mark_sent(message_ids)
+
+  messages = {c: m for c, m in zip(clients, messages) if m is not None}
+  return gmail_api.send_messages(sender, messages, on_sent)
+
+
+def __task_kind(name) -> str:
+  return name[0] if isinstance(name, tuple) else name
+
+
+def failed_emails(results: dict) -> list:
+  """
+  Returns the clients whose report could not be emailed by a run
+
+  Parameters:
+  results: dictionary of task name to result returned by run
+  """
+  return [client for name, sent in results.items() if __task_kind(name) == "send"
+          for client, message_id in sent.items() if message_id is None]
+
+
+def __from_journal(name, result, quotes):
+  # the journal keeps the json of the records returned by the profile, quote and news tasks
+  kind = __task_kind(name)
+  if kind == "profile":
+    return records.Profile.from_json(result)
+  if kind == "quote":
+    return quotes.set(name[1], result)
+  if kind == "news":
+    return records.NewsDigest.from_json(result) if isinstance(result, dict) else records.decode_news(result)
+  return result
+
+
+def __add(scheduler: Scheduler, name, fn, args=(), deps=(), executor="io"):
+  # tasks are timed by the stage they belong to, except in rendering processes whose metrics are not collected
+  if not isinstance(scheduler.executors[executor], ProcessPoolExecutor):
+    fn = metrics.timed(__task_kind(name), fn)
+  return scheduler.add(name, fn, args=args, deps=deps, executor=executor)
+
+
+def __chart_executor(chart_mode):
+  if chart_mode == "png" and settings.CHART_WORKERS > 1:
+    # the runner's threads may hold locks while a worker is forked, so rendering processes are spawned
+    return ProcessPoolExecutor(max_workers=settings.CHART_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+  # the png figure template is shared by the whole process, so in process charts are rendered one at a time
+  return ThreadPoolExecutor(max_workers=1 if chart_mode == "png" else settings.PIPELINE_CPU_WORKERS)
+
+
+def __uploader(chart_mode):
+  # every png chart is uploaded through one pool, listing the storage folder once
+  return storage_api.get_uploader() if chart_mode == "png" else contextlib.nullcontext()
+
+
+def add_stock_tasks(scheduler: Scheduler, stocks, output_dir: str, chart_mode="png", quotes=None, uploader=None) -> None:
+  """
+  Adds the tasks that fetch, score, chart and render the report section of every stock to a scheduler
+
+  Parameters:
+  scheduler: scheduler with "io", "cpu" and "charts" executors
+  stocks: list of stock symbols
+  output_dir: path to the temporary directory png charts are rendered to
+  chart_mode: "png" charts are uploaded to the storage backend, "svg" charts are embedded in the reports
+  quotes: records.QuoteTable the quotes are stored in. default is a new table
+  uploader: storage_api.Uploader every png chart is uploaded with, required for png charts
+  """
+  stocks = sorted(set(stocks))
+  if not stocks:
+    return
+  if quotes is None:
+    quotes = records.QuoteTable(stocks)
+  start, end = util_functions.get_news_window()
+  if chart_mode == "png":
+    # matplotlib is only imported when png charts are requested
+    from .charts import png_charts
+  prices = __add(scheduler, "prices", yfinance_api.update_price_store, args=(stocks,))
+  memo = sentiment_analysis.ScoreMemo()
+  deduped = None
+  if settings.NEWS_DEDUPE and settings.NEWS_INGESTION == "full":
+    # near-duplicate stories are found across every stock's news, so sentiment and sections wait for all the news
+    deduped = __add(scheduler, "dedupe", __dedupe, args=(stocks,), deps=[("news", s) for s in stocks], executor="cpu")
+  for s in stocks:
+    __add(scheduler, ("profile", s), util_functions.get_company_profile, args=(s,))
+    __add(scheduler, ("quote", s), __quote, args=(quotes, s))
+    if settings.NEWS_INGESTION == "stream":
+      # the digest's sentiment is scored while its news is read
+      __add(scheduler, ("news", s), news_digest.get_company_news_digest, args=(s, start, end))
+      __add(scheduler, ("sentiment", s), __digest_sentiment, deps=[("news", s)], executor="cpu")
+    elif deduped is not None:
+      __add(scheduler, ("news", s), finnhub_api.get_company_news, args=(s, start, end))
+      __add(scheduler, ("sentiment", s), __story_sentiment, args=(s,), deps=[deduped], executor="cpu")
+    else:
+      __add(scheduler, ("news", s), finnhub_api.get_company_news, args=(s, start, end))
+      __add(scheduler, ("sentiment", s), __sentiment, args=(s, memo), deps=[("news", s)], executor="cpu")
+    if chart_mode == "svg":
+      chart = __add(scheduler, ("chart", s), __svg_chart, args=(s,), deps=[prices], executor="charts")
+    else:
+      job = __add(scheduler, ("chart_job", s), __png_chart_job, args=(s, output_dir), deps=[prices])
+      rendered = __add(scheduler, ("render", s), png_charts.render_job, deps=[job], executor="charts")
+      chart = __add(scheduler, ("chart", s), __upload, args=(uploader,), deps=[rendered])
+    __add(scheduler, ("section", s), __section, args=(s, chart_mode == "svg"),
+                  deps=[("profile", s), ("quote", s), ("sentiment", s), deduped or ("news", s), chart], executor="cpu")
+
+
+def add_client_tasks(scheduler: Scheduler, clients: dict, output_dir: str, manifest, sender=None, state=None) -> None:
+  """
+  Adds the tasks that write and email the report of every client to a scheduler. The section tasks of the
+  clients' stocks must have been added with add_stock_tasks
+
+  Parameters:
+  scheduler: scheduler with "cpu" and "email" executors
+  clients: dictionary of client email to list of stock symbols
+  output_dir: path to the temporary directory, reports are written to ${output_dir}/reports
+  manifest: report_manifest.ReportManifest the reports are recorded in
+  sender: email address the reports are sent from. reports are not emailed when None
+  state: optional config_index.DeltaState, skipping the reports that are the same as when they were last emailed
+  """
+  for client in clients:
+    # a client's report is only reused by a resumed run while its stocks stay the same
+    report = __add(scheduler, ("report", client, tuple(clients[client])), __report, args=(client, clients[client], output_dir, manifest, state),
+                           deps=[("section", s) for s in clients[client]], executor="cpu")
+    if sender is not None:
+      __add(scheduler, ("message", client), __message, args=(sender, client, manifest), deps=[report], executor="cpu")
+  if sender is not None and clients:
+    # messages are sent together so they can share batch requests
+    __add(scheduler, ("send", tuple(clients)), __send, args=(sender, list(clients), manifest, state), deps=[("message", c) for c in clients], executor="email")
+
+
+def run(clients: dict, output_dir: str, chart_mode="png", sender=None, resume=False, stocks=(), sections=None, journal_name=None,
+        state=None) -> dict:
+  """
+  Fetches, scores, charts, writes and emails the reports of every client as one dependency graph.
+  Returns a dictionary of task name to result
+
+  Parameters:
+  clients: dictionary of client email to list of stock symbols
+  output_dir: path to the temporary directory, reports are written to ${output_dir}/reports
+  chart_mode: "png" charts are uploaded to the storage backend, "svg" charts are embedded in the reports
+  sender: email address the reports are sent from. reports are not emailed when None
+  resume: skip the tasks finished by earlier runs of the day
+  stocks: stock symbols whose sections are rendered in addition to the stocks of the clients
+  sections: optional dictionary of stock symbol to its section rendered elsewhere, e.g. by another shard
+  journal_name: name of the run journal, separating the journals of runs that share a JOURNAL_DIR
+  state: optional config_index.DeltaState of the previous run. only the reports of clients whose stocks or stock
+         sections changed since their report was last emailed are written and sent
+  """
+  reports_dir = os.path.join(output_dir, "reports")
+  os.makedirs(reports_dir, exist_ok=True)
+  manifest = report_manifest.load(reports_dir)
+  journal = run_journal.start(resume, name=journal_name)
+  all_stocks = sorted(set(stocks).union(*clients.values()))
+  quotes = records.QuoteTable(all_stocks)
+  completed = {name: __from_journal(name, result, quotes) for name, result in journal.completed.items()}
+  completed.update((("section", s), section) for s, section in (sections or {}).items())
+  for name, report in journal.completed.items():
+    if __task_kind(name) != "report" or report is None:
+      continue
+    if not os.path.exists(report["path"]):
+      # the report was removed since it was journaled, e.g. with its temporary directory, so it is written again
+      log.info("Journaled report of %s is missing at %s. Writing it again", name[1], report["path"])
+      del completed[name]
+    elif manifest.get(name[1]) is None:
+      # reports written before the manifest was saved are recorded again so their emails can be tracked
+      manifest.add(name[1], report["path"], report["size"], report["hash"])
+
+  def on_done(name, result):
+    if __task_kind(name) in JOURNALED_TASKS:
+      journal.record(name, result)
+    bar.next()
+
+  with ThreadPoolExecutor(max_workers=settings.FINNHUB_MAX_IN_FLIGHT) as io_executor, \
+       ThreadPoolExecutor(max_workers=settings.PIPELINE_CPU_WORKERS) as cpu_executor, \
+       __chart_executor(chart_mode) as chart_executor, \
+       ThreadPoolExecutor(max_workers=1) as email_executor, \
+       __uploader(chart_mode) as uploader:
+    scheduler = Scheduler({"io": io_executor, "cpu": cpu_executor, "charts": chart_executor, "email": email_executor})
+    add_stock_tasks(scheduler, all_stocks, output_dir, chart_mode, quotes, uploader)
+    add_client_tasks(scheduler, clients, output_dir, manifest, sender, state)
+    bar = Bar('Running Pipeline', max=len(scheduler.tasks))
+    try:
+      results = scheduler.run(on_done=on_done, completed=completed)
+    finally:
+      journal.close()
+      if state is not None:
+        state.save()
+    bar.finish()
+  manifest.save()
+  log.info("Ran %d tasks for %d clients", len(results), len(clients))
+  if state is not None:
+    changed, affected = state.changed_stocks()
+    skipped = sum(1 for name, r in results.items() if __task_kind(name) == "report" and r is None)
+    log.info("%d stocks changed since the previous run, affecting %d clients. %d unchanged reports were skipped",
+             len(changed), len(affected), skipped)
+  return results
@@ -0,0 +1,186 @@
+import threading
+import numpy as np
+
+# Compact records of the api data the reports and sentiment use. Api responses are decoded into them as they arrive,
+# so only the fields below stay in memory and in the response cache instead of every field of every response.
+# Every record converts back to the json of its fields with to_json, e.g. for the run journal
+
+NEWS_FIELDS = ("headline", "summary", "url", "image", "source", "datetime")
+QUOTE_FIELDS = ("o", "c", "h", "l")
+
+# json type of each quote field, so a quote renders exactly as finnhub sent it, e.g. 150 and not 150.0
+MISSING, FLOAT, INT, NULL = 0, 1, 2, 3
+QUOTE_DTYPE = np.dtype([("values", "f8", (len(QUOTE_FIELDS),)), ("kinds", "u1", (len(QUOTE_FIELDS),))])
+
+
+class Profile:
+  __slots__ = ("name", "industry")
+
+  def __init__(self, name: str, industry: str):
+    self.name = name
+    self.industry = industry
+
+  def to_json(self) -> dict:
+    return {"name": self.name, "industry": self.industry}
+
+  @classmethod
+  def from_json(cls, data: dict) -> "Profile":
+    return cls(data["name"], data["industry"])
+
+
+class NewsArticle:
+  __slots__ = NEWS_FIELDS
+
+  def __init__(self, headline, summary, url, image, source, datetime):
+    self.headline = headline
+    self.summary = summary
+    self.url = url
+    self.image = image
+    self.source = source
+    self.datetime = datetime
+
+  def to_json(self) -> dict:
+    return {f: getattr(self, f) for f in NEWS_FIELDS}
+
+  @classmethod
+  def from_json(cls, data: dict) -> "NewsArticle":
+    return cls(data.get("headline"), data.get("summary"), data.get("url"), data.get("image"), data.get("source"),
+               data.get("datetime"))
+
+
+def project_news(data: list) -> list:
+  """
+  Returns the articles of a company news response with only the fields kept by NewsArticle
+  """
+  if not isinstance(data, list):
+    return []
+  return [{f: article.get(f) for f in NEWS_FIELDS} for article in data]
+
+
+def decode_news(data: list) -> list:
+  """
+  Returns the NewsArticle records of a company news response
+  """
+  if not isinstance(data, list):
+    return []
+  return [NewsArticle.from_json(article) for article in data]
+
+
+class NewsDigest:
+  """
+  The articles of a stock shown in the reports and the running sentiment aggregate of all its articles,
+  see src/news_digest.py
+  """
+  __slots__ = ("articles", "total", "count")
+
+  def __init__(self, articles: list, total: float, count: int):
+    self.articles = articles
+    self.total = total
+    self.count = count
+
+  def sentiment(self):
+    """
+    Returns the mean sentiment of the texts of the articles rounded to 2 decimals, or "N/A" when there are none
+    """
+    if self.count == 0:
+      return "N/A"
+    return float("{0:.2f}".format(self.total / self.count))
+
+  def to_json(self) -> dict:
+    return {"articles": [a.to_json() for a in self.articles], "total": self.total, "count": self.count}
+
+  @classmethod
+  def from_json(cls, data: dict) -> "NewsDigest":
+    return cls(decode_news(data["articles"]), data["total"], data["count"])
+
+
+def project_quote(data: dict) -> dict:
+  """
+  Returns a quote response with only the fields kept by QuoteTable
+  """
+  return {f: data[f] for f in QUOTE_FIELDS if f in data}
+
+
+class Quote:
+  """
+  View of a stock's row in a QuoteTable
+  """
+  __slots__ = ("table", "row")
+
+  def __init__(self, table, row: int):
+    self.table = table
+    self.row = row
+
+  def get(self, field: str, default=None):
+    """
+    Returns a field of the quote as finnhub sent it, or default when finnhub left it out
+    """
+    i = QUOTE_FIELDS.index(field)
+    record = self.table.data[self.row]
+    kind = record["kinds"][i]
+    if kind == MISSING:
+      return default
+    if kind == NULL:
+      return None
+    value = float(record["values"][i])
+    return int(value) if kind == INT else value
+
+  def text(self, field: str) -> str:
+    """
+    Returns a field of the quote as shown in the reports, N/A when finnhub left it out
+    """
+    return str(self.get(field, "N/A"))
+
+  def to_json(self) -> dict:
+    missing = object()
+    values = {f: self.get(f, missing) for f in QUOTE_FIELDS}
+    return {f: v for f, v in values.items() if v is not missing}
+
+
+class QuoteTable:
+  """
+  Quotes of every stock in one numpy structured array, one row per stock
+  """
+
+  def __init__(self, symbols=()):
+    self.rows = {s: i for i, s in enumerate(symbols)}
+    self.data = np.zeros(max(len(self.rows), 1), dtype=QUOTE_DTYPE)
+    self.lock = threading.Lock()
+
+  def set(self, symbol: str, quote: dict) -> Quote:
+    """
+    Stores the quote of a stock and returns its view
+
+    Parameters:
+    symbol: stock symbol
+    quote: quote response, see project_quote
+    """
+    values = [0.0] * len(QUOTE_FIELDS)
+    kinds = [MISSING] * len(QUOTE_FIELDS)
+    for i, f in enumerate(QUOTE_FIELDS):
+      if f not in quote:
+        continue
+      v = quote[f]
+      if v is None:
+        kinds[i] = NULL
+      else:
+        values[i] = v
+        kinds[i] = INT if isinstance(v, int) else FLOAT
+    with self.lock:
+      row = self.rows.get(symbol)
+      if row is None:
+        row = self.rows[symbol] = len(self.rows)
+        if row >= len(self.data):
+          # stocks not known up front grow the table by doubling
+          self.data = np.concatenate([self.data, np.zeros(len(self.data), dtype=QUOTE_DTYPE)])
+      self.data[row] = (values, kinds)
+    return Quote(self, row)
+
+  def __getitem__(self, symbol: str) -> Quote:
+    return Quote(self, self.rows[symbol])
+
+  def __contains__(self, symbol: str) -> bool:
+    return symbol in self.rows
+
+  def __len__(self) -> int:
+    return len(self.rows)
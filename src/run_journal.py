@@ -0,0 +1,77 @@
+from . import settings
+import threading
+import datetime
+import logging as log
+import json
+import os
+
+
+def __to_name(value):
+  # json turns the tuple task names into lists
+  if isinstance(value, list):
+    return tuple(__to_name(v) for v in value)
+  return value
+
+
+class RunJournal:
+  """
+  Append only log of the tasks finished by the runs of a day and their results, one json line per task.
+  Lines are flushed as tasks finish so a crashed run loses at most the task that was being written
+  """
+
+  def __init__(self, path: str, completed: dict):
+    self.path = path
+    self.completed = completed
+    self.lock = threading.Lock()
+    self.file = open(path, 'a')
+
+  def record(self, name, result) -> None:
+    """
+    Records a finished task
+
+    Parameters:
+    name: task name
+    result: json serializable result of the task, or a record of src/records.py
+    """
+    line = json.dumps({"task": name, "result": result}, separators=(",", ":"), default=lambda r: r.to_json()) + "\n"
+    with self.lock:
+      self.file.write(line)
+      self.file.flush()
+
+  def close(self) -> None:
+    with self.lock:
+      self.file.close()
+
+
+def start(resume=False, date=None, name=None) -> RunJournal:
+  """
+  Returns the journal of a day's run. A resumed journal keeps the tasks finished by earlier runs of the day,
+  otherwise the day's journal is started over
+
+  Parameters:
+  resume: load the tasks finished by earlier runs of the day
+  date: journal date in format YYYYMMDD. default is today
+  name: optional journal name, for runs of the same day that do different work
+  """
+  date = date or datetime.datetime.today().strftime("%Y%m%d")
+  os.makedirs(settings.JOURNAL_DIR, exist_ok=True)
+  path = os.path.join(settings.JOURNAL_DIR, date + ("-" + name if name else "") + ".jsonl")
+  completed = {}
+  if resume and os.path.exists(path):
+    with open(path, 'r') as f:
+      lines = f.read()
+    if lines and not lines.endswith("\n"):
+      # end a line cut off by a crash so new lines are not appended to it
+      with open(path, 'a') as f:
+        f.write("\n")
+    for line in lines.splitlines():
+      try:
+        entry = json.loads(line)
+      except ValueError:
+        log.warning("Skipping truncated line of run journal %s", path)
+        continue
+      completed[__to_name(entry["task"])] = entry["result"]
+    log.info("Resuming run with %d finished tasks from %s", len(completed), path)
+  elif os.path.exists(path):
+    os.remove(path)
+  return RunJournal(path, completed)
@@ -0,0 +1,115 @@
+from concurrent.futures import wait, FIRST_COMPLETED
+import logging as log
+
+
+class Task:
+  def __init__(self, fn, args, deps, executor):
+    self.fn = fn
+    self.args = args
+    self.deps = deps
+    self.executor = executor
+
+
+class Scheduler:
+  """
+  Runs a dependency graph of tasks. Each task is submitted to its executor as soon as every task it depends on
+  has finished, so independent chains (e.g. the news and sentiment of different stocks) overlap
+  """
+
+  def __init__(self, executors: dict):
+    """
+    Parameters:
+    executors: dictionary of executor name to concurrent.futures executor
+    """
+    self.executors = executors
+    self.tasks = {}
+
+  def add(self, name, fn, args=(), deps=(), executor="io"):
+    """
+    Adds a task that calls fn(*args, *results of deps) on the named executor
+
+    Parameters:
+    name: unique hashable task name, e.g. ("news", "AAPL")
+    fn: function to call
+    args: positional arguments passed before the results of the dependencies
+    deps: names of the tasks this task depends on
+    executor: name of the executor to run on
+    """
+    if name in self.tasks:
+      raise ValueError("Task already exists: " + str(name))
+    if executor not in self.executors:
+      raise ValueError("Invalid executor: " + executor + ". Valid executors include: " + ", ".join(self.executors))
+    self.tasks[name] = Task(fn, tuple(args), tuple(deps), executor)
+    return name
+
+  def __needed(self, completed: dict) -> set:
+    """
+    Returns the names of the tasks that have to run: every unfinished task that no other task depends on and the
+    unfinished tasks they depend on. Tasks only needed by finished tasks are skipped
+    """
+    has_dependents = set(dep for task in self.tasks.values() for dep in task.deps)
+    stack = [name for name in self.tasks if name not in has_dependents and name not in completed]
+    needed = set()
+    while stack:
+      name = stack.pop()
+      if name in needed:
+        continue
+      needed.add(name)
+      stack.extend(dep for dep in self.tasks[name].deps if dep not in completed)
+    return needed
+
+  def run(self, on_done=None, completed=None) -> dict:
+    """
+    Runs every task and returns a dictionary of task name to result. The first failing task stops the run and its exception is raised
+
+    Parameters:
+    on_done: optional callback called with the name and result of every finished task
+    completed: optional dictionary of task name to result of tasks finished by an earlier run, which are not run again
+    """
+    for name, task in self.tasks.items():
+      for dep in task.deps:
+        if dep not in self.tasks:
+          raise ValueError("Task " + str(name) + " depends on unknown task " + str(dep))
+    completed = {name: result for name, result in (completed or {}).items() if name in self.tasks}
+    needed = self.__needed(completed)
+
+    waiting = {}
+    dependents = {}
+    for name in needed:
+      task = self.tasks[name]
+      deps = [dep for dep in task.deps if dep in needed]
+      for dep in deps:
+        dependents.setdefault(dep, []).append(name)
+      waiting[name] = len(deps)
+
+    results = dict(completed)
+    running = {}
+
+    def submit(name):
+      task = self.tasks[name]
+      args = task.args + tuple(results[dep] for dep in task.deps)
+      running[self.executors[task.executor].submit(task.fn, *args)] = name
+
+    for name in needed:
+      if waiting[name] == 0:
+        submit(name)
+    while running:
+      done, _ = wait(running, return_when=FIRST_COMPLETED)
+      for future in done:
+        name = running.pop(future)
+        try:
+          results[name] = future.result()
+        except Exception:
+          log.error("Task %s failed. Cancelling %d running tasks", str(name), len(running))
+          for other in running:
+            other.cancel()
+          raise
+        if on_done is not None:
+          on_done(name, results[name])
+        for dependent in dependents.get(name, []):
+          waiting[dependent] -= 1
+          if waiting[dependent] == 0:
+            submit(dependent)
+    if any(name not in results for name in needed):
+      raise ValueError("Dependency cycle between tasks: " + ", ".join(str(n) for n in needed if n not in results))
+    return results
@@ -0,0 +1,206 @@
+from typing import List
+import logging as log
+import pickle
+import os
+import re
+from .. import settings
+
+# Port of the pattern analyzer that backs TextBlob(text).sentiment.polarity.
+# The lexicon is compiled once from TextBlob's en-sentiment.xml into a flat table of
+# word -> (polarity, intensity, is_modifier) and stored at settings.SENTIMENT_LEXICON_PATH,
+# so later runs load it without importing textblob.
+
+NEGATIONS = frozenset(("no", "not", "n't", "never"))
+ABBREVIATIONS = frozenset((
+  "a.", "adj.", "adv.", "al.", "a.m.", "c.", "cf.", "comp.", "conf.", "def.", "ed.", "e.g.", "esp.", "etc.", "ex.",
+  "f.", "fig.", "gen.", "id.", "i.e.", "int.", "l.", "m.", "Med.", "Mil.", "Mr.", "n.", "n.q.", "orig.", "pl.",
+  "pred.", "pres.", "p.m.", "ref.", "v.", "vs.", "w/"
+))
+RE_ABBR = re.compile(r"^(?:[A-Za-z]\.)+$|^[A-Z][bcdfghjklmnpqrstvwxz]+.$")
+PUNCTUATION = ".,;:!?()[]{}`''\"@#$^&*+-|=~_"
+EMOTICONS = [
+  (+1.00, ("<3", "♥")),
+  (+1.00, (">:D", ":-D", ":D", "=-D", "=D", "X-D", "x-D", "XD", "xD", "8-D")),
+  (+0.75, (">:P", ":-P", ":P", ":-p", ":p", ":-b", ":b", ":c)", ":o)", ":^)")),
+  (+0.50, (">:)", ":-)", ":)", "=)", "=]", ":]", ":}", ":>", ":3", "8)", "8-)")),
+  (+0.25, (">;]", ";-)", ";)", ";-]", ";]", ";D", ";^)", "*-)", "*)")),
+  (+0.05, (">:o", ":-O", ":O", ":o", ":-o", "o_O", "o.O", "°O°", "°o°")),
+  (-0.25, (">:/", ":-/", ":/", ":\\", ">:\\", ":-.", ":-s", ":s", ":S", ":-S", ">.>")),
+  (-0.75, (">:[", ":-(", ":(", "=(", ":-[", ":[", ":{", ":-<", ":c", ":-c", "=/")),
+  (-1.00, (":'(", ":'''(", ";'("))
+]
+EMOTICON_POLARITY = {}
+for polarity, faces in EMOTICONS:
+  for face in faces:
+    EMOTICON_POLARITY.setdefault(face.lower(), polarity)
+
+__QUOTES = re.escape("“”‘’'\"")
+__EDGE = re.escape(PUNCTUATION) + __QUOTES
+# One pass over the text: sarcasm marks, words that keep inner punctuation but not leading
+# or trailing punctuation, with an optional trailing period, ellipses, then any other single character
+TOKEN = re.compile(
+  r"(?P<sarcasm>\(\s*!\s*\))"
+  r"|(?P<word>\.*[^\s" + __EDGE + r"](?:[^\s" + __QUOTES + r"]*[^\s" + __EDGE + r"])?)(?P<period>\.(?!\.))?"
+  r"|(?P<ellipsis>\.\.\.)"
+  r"|(?P<other>\S)"
+)
+# Emoticons split apart by the tokenizer are joined back together, e.g. ": )" => ":)"
+RE_EMOTICONS = re.compile(r"(%s)($|\s)" % "|".join(r" ?".join(re.escape(c) for c in face) for _, faces in EMOTICONS for face in faces))
+
+__lexicon = None
+
+
+def __compile_lexicon() -> dict:
+  from textblob.en import sentiment as pattern_sentiment
+  table = {}
+  for word, senses in pattern_sentiment.items():
+    p, s, i = senses[None]
+    table[word] = (p, i, "RB" in senses)
+  return table
+
+
+def get_lexicon() -> dict:
+  """
+  Returns the compiled lexicon of word to (polarity, intensity, is_modifier), compiling and storing it on first use
+  """
+  global __lexicon
+  if __lexicon is None:
+    path = settings.SENTIMENT_LEXICON_PATH
+    if os.path.exists(path):
+      with open(path, 'rb') as f:
+        __lexicon = pickle.load(f)
+    else:
+      log.info("Compiling sentiment lexicon to %s", path)
+      __lexicon = __compile_lexicon()
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      with open(path, 'wb') as f:
+        pickle.dump(__lexicon, f, protocol=pickle.HIGHEST_PROTOCOL)
+  return __lexicon
+
+
+def tokenize(text: str) -> List[str]:
+  """
+  Returns the lowercase tokens of a text, splitting punctuation from words the way the pattern tokenizer does
+
+  Parameters:
+  text: string to be tokenized
+  """
+  # the pattern tokenizer splits "n't" from the preceding word before splitting quotes, "won't" => "wo n ' t"
+  text = text.replace("n't", " n't")
+  tokens = []
+  for m in TOKEN.finditer(text):
+    kind = m.lastgroup
+    if kind == "period":
+      word = m.group("word")
+      if word + "." in ABBREVIATIONS or RE_ABBR.match(word + ".") is not None:
+        tokens.append(word + ".")
+      else:
+        tokens.extend((word, "."))
+    elif kind == "sarcasm":
+      tokens.append("(!)")
+    else:
+      tokens.append(m.group(kind))
+  return RE_EMOTICONS.sub(lambda m: m.group(1).replace(" ", "") + m.group(2), " ".join(tokens)).lower().split()
+
+
+def get_sentiment(text: str) -> float:
+  """
+  Gets the sentiment polarity score of text with the compiled lexicon
+
+  Parameters:
+  text: string to be analyzed
+  """
+  lexicon = __lexicon if __lexicon is not None else get_lexicon()
+  # each assessment is [polarity, intensity, negated]
+  a = []
+  m = None
+  n = None
+  for w in tokenize(text):
+    entry = lexicon.get(w)
+    if entry is not None:
+      p, i, is_modifier = entry
+      if m is None:
+        a.append([p, i, False])
+      else:
+        last = a[-1]
+        last[0] = max(-1.0, min(p * last[1], +1.0))
+        last[1] = i
+      if n is not None:
+        a[-1][1] = 1.0 / a[-1][1]
+        a[-1][2] = True
+      m = w if is_modifier else None
+      n = w if w in NEGATIONS else None
+    else:
+      if w in NEGATIONS:
+        n = w
+      elif n and len(w.strip("'")) > 1:
+        n = None
+      if n is not None and m is not None and m.endswith("ly"):
+        a[-1][2] = True
+        n = None
+      elif m and len(w) > 2:
+        m = None
+      if w == "!" and a:
+        a[-1][0] = max(-1.0, min(a[-1][0] * 1.25, +1.0))
+      if w == "(!)":
+        a.append([0.0, 1.0, False])
+      if not w.isalpha() and len(w) <= 5 and w not in PUNCTUATION and w in EMOTICON_POLARITY:
+        a.append([EMOTICON_POLARITY[w], 1.0, False])
+  if not a:
+    return 0.0
+  return sum(p * -0.5 if negated else p for p, i, negated in a) / float(len(a))
+
+
+def get_sentiments(texts: List[str]) -> List[float]:
+  """
+  Gets the sentiment polarity score of every text in bulk
+
+  Parameters:
+  texts: strings to be analyzed
+  """
+  get_lexicon()
+  return [get_sentiment(t) for t in texts]
+
+
+# Fixed corpus used to check that the fast backend matches TextBlob
+PARITY_CORPUS = [
+  "Apple shares soared after the company reported record quarterly earnings.",
+  "Amazon stock fell sharply as investors worried about slowing growth.",
+  "Analysts are not very optimistic about the merger.",
+  "The outlook is really not good for the airline industry!",
+  "Tesla's new factory is a huge success, says CEO.",
+  "Shares were flat in early trading on Wall Street.",
+  "This is a terrible, horrible, no good, very bad day for the U.S. markets.",
+  "Microsoft beats expectations; cloud revenue grows 30% year over year.",
+  "Investors remain cautious ahead of the Fed meeting :(",
+  "Great results :) but guidance was disappointing.",
+  "The company didn't meet its targets and the stock was never able to recover.",
+  "Oil prices jumped to a two-year high as supply concerns mounted.",
+  "Regulators fined the bank $2.3bn for misleading customers.",
+  "Surprisingly strong demand lifted sales of the new iPhone (!)",
+  "It was an incredibly weak quarter... but the dividend is safe.",
+  "Netflix adds fewer subscribers than expected, shares slump 10%.",
+  "",
+  "Stocks rallied strongly on Friday, e.g. tech and energy names led the gains.",
+  "The deal is not bad at all, according to Mr. Smith.",
+  "Experts say the well-known brand faces an uncertain, difficult future."
+]
+
+
+def check_parity(texts=None, tolerance=1e-9) -> List[tuple]:
+  """
+  Returns the (text, textblob polarity, fast polarity) of every text whose scores differ by more than the tolerance
+
+  Parameters:
+  texts: strings to compare. default is PARITY_CORPUS
+  tolerance: maximum allowed absolute difference
+  """
+  from . import sentiment_analysis
+  mismatches = []
+  for text in (PARITY_CORPUS if texts is None else texts):
+    expected = sentiment_analysis.get_sentiment(text)
+    actual = get_sentiment(text)
+    if abs(expected - actual) > tolerance:
+      mismatches.append((text, expected, actual))
+  return mismatches
+
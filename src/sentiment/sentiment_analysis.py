@@ -1,6 +1,13 @@
 from textblob import TextBlob
 from typing import List
+from concurrent.futures import ProcessPoolExecutor, Future
+import multiprocessing
+import threading
+import hashlib
 import logging as log
+from .. import settings
+from ..api import response_cache
+from . import fast_sentiment
 
 
 def get_sentiment(text: str) -> float:
@@ -12,3 +19,111 @@ def get_sentiment(text: str) -> float:
   """
   analysis = TextBlob(text)
   return analysis.sentiment.polarity
+
+
+def __text_key(text: str) -> str:
+  return settings.SENTIMENT_BACKEND + ":" + hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def __score_texts(texts: List[str]) -> List[float]:
+  if settings.SENTIMENT_BACKEND == "fast":
+    return fast_sentiment.get_sentiments(texts)
+  workers = settings.SENTIMENT_WORKERS
+  if workers <= 1 or len(texts) <= settings.SENTIMENT_BATCH_SIZE:
+    return [get_sentiment(t) for t in texts]
+  # texts are scored from the runner's threads, and forking a threaded process is unsafe, so workers are spawned
+  with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+    return list(executor.map(get_sentiment, texts, chunksize=settings.SENTIMENT_BATCH_SIZE))
+
+
+class ScoreMemo:
+  """
+  Scores of the texts scored so far by a run, shared by concurrent get_sentiments calls. A text is scored once
+  even when the response cache is disabled or several stocks miss the same text at the same time
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.futures = {}
+
+  def claim(self, keys: List[str]) -> (list, dict):
+    """
+    Returns the keys the caller has to score and a dictionary of key to future of the keys scored or being scored
+    by other callers. Every claimed key must be resolved with resolve
+    """
+    claimed = []
+    others = {}
+    with self.lock:
+      for key in keys:
+        if key in self.futures:
+          others[key] = self.futures[key]
+        else:
+          self.futures[key] = Future()
+          claimed.append(key)
+    return claimed, others
+
+  def resolve(self, scores: dict, error=None) -> None:
+    """
+    Sets the scores of claimed keys, or releases them with the error that stopped them from being scored
+
+    Parameters:
+    scores: dictionary of claimed key to score, or to None when error is given
+    error: optional exception raised to the other callers waiting for the keys
+    """
+    with self.lock:
+      futures = [(self.futures[key], scores[key]) for key in scores]
+      if error is not None:
+        for key in scores:
+          # a later call scores the text again
+          del self.futures[key]
+    for future, score in futures:
+      if error is not None:
+        future.set_exception(error)
+      else:
+        future.set_result(score)
+
+
+def __get_scores(unique: List[str], keys: List[str]) -> (dict, int):
+  cached = response_cache.get_many("sentiment", keys)
+  scores = {}
+  missing = []
+  for text, key in zip(unique, keys):
+    if key in cached:
+      scores[text] = cached[key]
+    else:
+      missing.append(text)
+  new_scores = __score_texts(missing)
+  scores.update(zip(missing, new_scores))
+  response_cache.put_many("sentiment", {__text_key(t): s for t, s in zip(missing, new_scores)})
+  return scores, len(unique) - len(missing)
+
+
+def get_sentiments(texts: List[str], memo=None) -> dict:
+  """
+  Returns a dictionary of text to its sentiment polarity score using settings.SENTIMENT_BACKEND.
+  Each distinct text is scored once, scores are cached on disk by text hash
+  and texts without a cached score are scored in batches over a process pool, or in bulk by the fast backend
+
+  Parameters:
+  texts: strings to be analyzed, may contain duplicates
+  memo: optional ScoreMemo shared with the other calls of a run, so texts scored by another call are not scored again
+  """
+  unique = list(dict.fromkeys(texts))
+  keys = [__text_key(t) for t in unique]
+  if memo is None:
+    scores, cached = __get_scores(unique, keys)
+    log.info("Scoring %d texts, %d distinct, %d cached", len(texts), len(unique), cached)
+    return scores
+  claimed, others = memo.claim(keys)
+  text_of = dict(zip(keys, unique))
+  try:
+    scores, cached = __get_scores([text_of[k] for k in claimed], claimed)
+  except BaseException as e:
+    memo.resolve(dict.fromkeys(claimed), e)
+    raise
+  memo.resolve({k: scores[text_of[k]] for k in claimed})
+  log.debug("Scoring %d texts, %d distinct, %d cached, %d scored by other calls", len(texts), len(unique), cached,
+            len(others))
+  # every claimed text is scored before waiting, so two calls never wait for each other
+  scores.update((text_of[k], future.result()) for k, future in others.items())
+  return scores
@@ -7,3 +7,109 @@ FINNHUB_KEY = os.getenv("FINNHUB_API_KEY")
 GCP_BUCKET = os.getenv("GCP_BUCKET")
 GOOGLE_APP_CREDS = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 GOOGLE_APP_SECRET = os.getenv("GOOGLE_APP_SECRET")
+
+# Api base urls, overridden to point the clients at local stand-in servers
+FINNHUB_URL = os.getenv("FINNHUB_URL", "https://finnhub.io/api/v1")
+NEWS_URL = os.getenv("NEWS_URL", "https://newsapi.org/v2")
+
+# Maximum number of finnhub requests in flight at once
+FINNHUB_MAX_IN_FLIGHT = int(os.getenv("FINNHUB_MAX_IN_FLIGHT", "16"))
+
+# Provider rate limits and retry policy shared by the finnhub and news api clients
+FINNHUB_RATE_PER_SECOND = float(os.getenv("FINNHUB_RATE_PER_SECOND", "30"))
+FINNHUB_RATE_PER_MINUTE = float(os.getenv("FINNHUB_RATE_PER_MINUTE", "60"))
+NEWS_RATE_PER_SECOND = float(os.getenv("NEWS_RATE_PER_SECOND", "5"))
+NEWS_RATE_PER_MINUTE = float(os.getenv("NEWS_RATE_PER_MINUTE", "100"))
+# messages.send costs 100 of the 250 quota units/second and 15000 units/minute of a gmail user
+GMAIL_RATE_PER_SECOND = float(os.getenv("GMAIL_RATE_PER_SECOND", "2.5"))
+GMAIL_RATE_PER_MINUTE = float(os.getenv("GMAIL_RATE_PER_MINUTE", "150"))
+MAX_RETRIES = int(os.getenv("MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("BACKOFF_BASE", "0.5"))
+BACKOFF_CAP = float(os.getenv("BACKOFF_CAP", "30"))
+
+# Pooled http session used by the api clients
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", str(FINNHUB_MAX_IN_FLIGHT)))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+
+# Persistent response cache shared by the api clients
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() != "false"
+CACHE_PATH = os.getenv("CACHE_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "responses.sqlite"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+CACHE_TTLS = {
+  "profile": int(os.getenv("PROFILE_CACHE_TTL", str(7 * 24 * 3600))),
+  "news": int(os.getenv("NEWS_CACHE_TTL", str(6 * 3600))),
+  "quote": int(os.getenv("QUOTE_CACHE_TTL", str(5 * 60))),
+  "candle": int(os.getenv("CANDLE_CACHE_TTL", str(6 * 3600))),
+  "financials": int(os.getenv("FINANCIALS_CACHE_TTL", str(7 * 24 * 3600))),
+  "headlines": int(os.getenv("HEADLINES_CACHE_TTL", str(3600))),
+  "yf_profile": int(os.getenv("YF_PROFILE_CACHE_TTL", str(7 * 24 * 3600))),
+  "sentiment": int(os.getenv("SENTIMENT_CACHE_TTL", str(30 * 24 * 3600))),
+  "profile_source": int(os.getenv("PROFILE_SOURCE_CACHE_TTL", str(30 * 24 * 3600)))
+}
+
+# Seconds a company profile lookup waits for finnhub before also asking yfinance, see src/api/profile_resolver.py
+PROFILE_HEDGE_DELAY = float(os.getenv("PROFILE_HEDGE_DELAY", "0.5"))
+
+# Batched yfinance price downloads. PRICE_DATA_DIR points at a local stand-in directory of ${TICKER}.csv files
+YF_BATCH_SIZE = int(os.getenv("YF_BATCH_SIZE", "100"))
+PRICE_DATA_DIR = os.getenv("PRICE_DATA_DIR")
+
+# Local price store of daily bars, appended to incrementally
+PRICE_STORE_DIR = os.getenv("PRICE_STORE_DIR", os.path.join(os.path.dirname(CACHE_PATH), "prices"))
+PRICE_STORE_MAX_DAYS = int(os.getenv("PRICE_STORE_MAX_DAYS", "120"))
+PRICE_HISTORY_DAYS = int(os.getenv("PRICE_HISTORY_DAYS", "92"))
+
+# Number of processes rendering charts
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", str(os.cpu_count() or 1)))
+
+# Chart image storage, either "gcs" for the GCP_BUCKET or "local" for LOCAL_STORAGE_DIR
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "gcs").lower()
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", os.path.join(os.path.dirname(CACHE_PATH), "storage"))
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "8"))
+
+# Sentiment scoring of news texts that are not cached yet
+SENTIMENT_WORKERS = int(os.getenv("SENTIMENT_WORKERS", str(os.cpu_count() or 1)))
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "256"))
+
+# Sentiment backend, either "textblob" or the compiled lexicon "fast" backend
+SENTIMENT_BACKEND = os.getenv("SENTIMENT_BACKEND", "textblob").lower()
+SENTIMENT_LEXICON_PATH = os.getenv("SENTIMENT_LEXICON_PATH", os.path.join(os.path.dirname(CACHE_PATH), "sentiment_lexicon.pickle"))
+
+# Company news ingestion, either "full" responses or "stream", which parses responses as they download and keeps only
+# the NEWS_TOP_N most recent articles of a stock and a running sentiment aggregate, see src/news_digest.py
+NEWS_INGESTION = os.getenv("NEWS_INGESTION", "full").lower()
+# the reports show 5 articles of every stock
+NEWS_TOP_N = int(os.getenv("NEWS_TOP_N", "5"))
+NEWS_STREAM_CHUNK_SIZE = int(os.getenv("NEWS_STREAM_CHUNK_SIZE", str(64 * 1024)))
+
+# Cross-ticker deduplication of near-duplicate company news, see src/news_dedupe.py. Articles whose word 3-grams have
+# an estimated jaccard similarity of at least the threshold are one story, e.g. a wire story with a word or two
+# edited. 16 bands of 4 MinHash rows find 99% of the pairs at the default threshold
+NEWS_DEDUPE = os.getenv("NEWS_DEDUPE", "false").lower() == "true"
+NEWS_DEDUPE_THRESHOLD = float(os.getenv("NEWS_DEDUPE_THRESHOLD", "0.7"))
+NEWS_DEDUPE_PERMUTATIONS = int(os.getenv("NEWS_DEDUPE_PERMUTATIONS", "64"))
+NEWS_DEDUPE_BANDS = int(os.getenv("NEWS_DEDUPE_BANDS", "16"))
+
+# Journals of the tasks finished by each day's runs, used to resume a failed run
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", os.path.join(os.path.dirname(CACHE_PATH), "journal"))
+
+# Threads that run the cpu bound stages (sentiment, svg charts, report sections) of the pipelined runner
+PIPELINE_CPU_WORKERS = int(os.getenv("PIPELINE_CPU_WORKERS", str(os.cpu_count() or 1)))
+
+# Bulk email sending, either through "gmail" or the in memory "fake" service used to run the email stage offline
+GMAIL_BACKEND = os.getenv("GMAIL_BACKEND", "gmail").lower()
+GMAIL_BATCH_SIZE = int(os.getenv("GMAIL_BATCH_SIZE", "50"))
+GMAIL_MAX_IN_FLIGHT = int(os.getenv("GMAIL_MAX_IN_FLIGHT", "4"))
+GMAIL_FAKE_FAILURE_RATE = float(os.getenv("GMAIL_FAKE_FAILURE_RATE", "0"))
+GMAIL_FAKE_LATENCY = float(os.getenv("GMAIL_FAKE_LATENCY", "0"))
+
+# Directory shared by the shards of a sharded run, holding the report sections rendered by each stock shard
+SHARD_DIR = os.getenv("SHARD_DIR", os.path.join(os.path.dirname(CACHE_PATH), "shards"))
+
+# Run metrics written at the end of every run as ${name}.json and ${name}.prom, and --profile output
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(os.path.dirname(CACHE_PATH), "metrics"))
+
+# Compiled client config indexes and the per client state of the last delivered reports, see src/config_index.py
+CONFIG_INDEX_DIR = os.getenv("CONFIG_INDEX_DIR", os.path.join(os.path.dirname(CACHE_PATH), "config"))
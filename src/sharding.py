@@ -0,0 +1,91 @@
+from . import settings
+import datetime
+import hashlib
+import logging as log
+import json
+import os
+
+# A sharded run is split in two stages that only share settings.SHARD_DIR:
+#   sections: shard i of N renders the report sections of the stocks that hash to i and saves them to SHARD_DIR
+#   merge:    once every stock shard is saved, the reports of the clients that hash to i are written and emailed
+
+
+def shard_of(key: str, shards: int) -> int:
+  """
+  Returns the shard of a stock symbol or client email. Unlike hash() the shard is the same in every process
+
+  Parameters:
+  key: stock symbol or client email
+  shards: number of shards
+  """
+  return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big") % shards
+
+
+def partition_stocks(clients: dict, shards: int, index: int) -> list:
+  """
+  Returns the sorted stock symbols of a shard
+
+  Parameters:
+  clients: dictionary of client email to list of stock symbols
+  shards: number of shards
+  index: shard index, from 0 to shards - 1
+  """
+  stocks = set(s for client in clients for s in clients[client])
+  return sorted(s for s in stocks if shard_of(s, shards) == index)
+
+
+def partition_clients(clients: dict, shards: int, index: int) -> dict:
+  """
+  Returns the clients of a shard and their stock symbols
+
+  Parameters:
+  clients: dictionary of client email to list of stock symbols
+  shards: number of shards
+  index: shard index, from 0 to shards - 1
+  """
+  return {client: stocks for client, stocks in clients.items() if shard_of(client, shards) == index}
+
+
+def __sections_path(shards: int, index: int, date=None) -> str:
+  date = date or datetime.datetime.today().strftime("%Y%m%d")
+  return os.path.join(settings.SHARD_DIR, date, "sections-%d-of-%d.json" % (index, shards))
+
+
+def save_sections(sections: dict, shards: int, index: int, date=None) -> str:
+  """
+  Saves the report sections rendered by a stock shard and returns the path of the file.
+  The file is only visible once complete, so it doubles as the shard's done marker
+
+  Parameters:
+  sections: dictionary of stock symbol to its html section
+  shards: number of shards
+  index: shard index, from 0 to shards - 1
+  date: run date in format YYYYMMDD. default is today
+  """
+  path = __sections_path(shards, index, date)
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  tmp = path + ".tmp"
+  with open(tmp, 'w') as f:
+    json.dump(sections, f, separators=(",", ":"))
+  os.replace(tmp, path)
+  log.info("Saved %d report sections of shard %d of %d to %s", len(sections), index, shards, path)
+  return path
+
+
+def load_sections(shards: int, date=None) -> dict:
+  """
+  Returns the report sections saved by every stock shard of a run
+
+  Parameters:
+  shards: number of shards
+  date: run date in format YYYYMMDD. default is today
+  """
+  missing = [i for i in range(shards) if not os.path.exists(__sections_path(shards, i, date))]
+  if missing:
+    raise ValueError("Stock shards " + ", ".join(str(i) for i in missing) + " of " + str(shards) + " have not finished")
+  sections = {}
+  for index in range(shards):
+    with open(__sections_path(shards, index, date), 'r') as f:
+      sections.update(json.load(f))
+  log.info("Loaded %d report sections from %d shards", len(sections), shards)
+  return sections
@@ -1,63 +1,34 @@
-from typing import List
 import logging as log
 from datetime import datetime, timedelta
 from progress.bar import Bar
-from .api import finnhub_api
+from . import metrics
 from .api import news_api
-from .api import yfinance_api
 from .sentiment import sentiment_analysis
+from .api import profile_resolver
+from .records import Profile
 
 
-def get_company_profiles(stocks: List[str]) -> dict:
+def get_company_profile(s: str) -> Profile:
   """
-  Returns a dictionary of a company name to its profile object
+  Returns the records.Profile with the name and industry of a company from whichever of finnhub and yfinance
+  answers first, see src/api/profile_resolver.py
 
   Parameters:
-  stocks: list of stock symbols
+  s: stock symbol
   """
-  profiles = {}
-  bar = Bar('Retrieving Profiles', max=len(stocks))
-  for s in stocks:
-    p = {"name": "", "industry": ""}
-    fp = finnhub_api.get_company_profile(s)
-    if len(fp) == 0:
-      yp = yfinance_api.get_stock_profile(s)
-      if len(yp) == 0:
-        log.warn("No profile data was found of %s. Skipping", s)
-      else:
-        p["name"] = yp.get("shortName", s)
-        p["industry"] = yp.get("sector", s)
-    else:
-      p["name"] = fp.get("name",s)
-      p["industry"] = fp.get("finnhubIndustry",s)
-    profiles[s] = p
-    bar.next()
-  bar.finish()
-  log.info("Retrieved %d company profiles for %d stocks",
-           len(profiles), len(stocks))
-  return profiles
+  return profile_resolver.resolve(s)
 
 
-def get_company_news(stocks: List[str]) -> dict:
+def get_news_window() -> (str, str):
   """
-  Returns a dictionary of a company name to a list of news objects.
-  News articles are from the day before
-
-  Parameters:
-  stocks: list of stock symbols
+  Returns the start and end dates of the company news window, the day before yesterday to yesterday
   """
-  news = {}
   start = (datetime.today() - timedelta(days=2)).strftime("%Y-%m-%d")
   end = (datetime.today() - timedelta(days=1)).strftime("%Y-%m-%d")
-  bar = Bar('Retrieving Company News', max=len(stocks))
-  for s in stocks:
-    news[s] = finnhub_api.get_company_news(s, start, end)
-    bar.next()
-  bar.finish()
-  log.info("Retrieved company news for %d stocks", len(news))
-  return news
+  return start, end
 
 
+@metrics.stage("industry_news")
 def get_industry_news(profiles: dict) -> dict:
   """
   Returns a dictionary of a company name to a list of news objects.
@@ -67,7 +38,7 @@ def get_industry_news(profiles: dict) -> dict:
   """
   industries = set()
   for p in profiles:
-    industries.add(str(profiles[p]["industry"]).lower())
+    industries.add(str(profiles[p].industry).lower())
   i_news = {}
   bar = Bar('Retrieving Industry News', max=len(industries))
   for i in industries:
@@ -78,55 +49,32 @@ def get_industry_news(profiles: dict) -> dict:
   return i_news
 
 
-def create_historical_price_charts(stocks: List[str], temp_dir: str) -> None:
-  """
-  Creates line charts of historical prices for the following historical durations 3months,1month,1week
-
-  Parameters:
-  stocks: list of stock symbols
-  temp_dir: path to the location where the images will be saved to
-  """
-  for s in stocks:
-    yfinance_api.get_historical_prices(s, temp_dir)
-
-
-def get_stock_quotes(stocks: List[str]) -> dict:
-  """
-  Returns a dictionary of stock name to stock quote map
-
-  Parameters:
-  stocks: list of stock symbols
-  """
-  quotes = {}
-  for stock in stocks:
-    quotes[stock] = finnhub_api.get_stock_quote(stock)
-  return quotes
-  
-
 def __get_article_texts(company_news: dict) -> dict:
   """
   Returns a dictionary of company name to list of texts
 
   Parameters:
-  company_news: dictionary of company name to list of news article objects
+  company_news: dictionary of company name to list of records.NewsArticle
   """
   texts = {}
   for c in company_news:
     texts[c] = []
     for n in company_news[c]:
-      texts[c].append(n["summary"])
-      texts[c].append(n["headline"])
+      texts[c].append(n.summary)
+      texts[c].append(n.headline)
   return texts
 
 
-def get_sentiment_scores(company_news: dict) -> dict:
+def get_sentiment_scores(company_news: dict, memo=None) -> dict:
   """
   Returns the sentiment score for each company based on the news for that company
 
   Parameters:
   company_news: dictionary of company to list of news articles
+  memo: optional sentiment_analysis.ScoreMemo shared by the calls of a run
   """
   company_texts = __get_article_texts(company_news)
+  text_scores = sentiment_analysis.get_sentiments([t for c in company_texts for t in company_texts[c]], memo)
 
   scores = {}
   log.info("Getting sentiment scores for %d companies.", len(company_texts))
@@ -137,7 +85,7 @@ def get_sentiment_scores(company_news: dict) -> dict:
       scores[company] = "N/A"
       continue
     for text in company_texts[company]:
-      temp_score = sentiment_analysis.get_sentiment(text)
+      temp_score = text_scores[text]
       total_score += temp_score
     if len(company_texts[company]) > 0:
       score = total_score / len(company_texts[company])
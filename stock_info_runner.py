@@ -1,26 +1,30 @@
 import logging as log
-from progress.bar import Bar
 import os
 import pathlib
 import shutil
-
-# for parsing the input yaml file
-import yaml
 import argparse
-import io
+import subprocess
+import sys
+from datetime import datetime
 
 # helper functions
-from src import util_functions
-from src.html import report_maker
-from src.api import gmail_api
+from src import pipeline
+from src import config_index
+from src import sharding
+from src import metrics
+from src.api import response_cache
+from src import settings
 
 
 log.basicConfig(
     format='%(asctime)s - [%(levelname)s] %(message)s', level=log.INFO)
 
 
-def __setup() -> None:
-  path = os.path.join(str(pathlib.Path(__file__).parent.absolute()),"tmp")
+def __setup(resume=False, name=None) -> None:
+  path = os.path.join(str(pathlib.Path(__file__).parent.absolute()),"tmp" + ("-" + name if name else ""))
+  if resume and os.path.exists(path):
+    log.info("Resuming with existing tmp directory at: %s", str(path))
+    return path
   if os.path.exists(path):
     log.info("tmp directory already exists. Removing.")
     shutil.rmtree(path)
@@ -29,30 +33,92 @@ def __setup() -> None:
   return path
 
 
+@metrics.stage("cleanup")
 def __cleanup(path) -> None:
   log.info("Removing temporary directory: %s", path)
   shutil.rmtree(path)
-  
 
-def __generate_reports(output_dir, clients, profiles, news, quotes, sentiment_scores) -> None:
-  reports_path = os.path.join(output_dir, "reports")
-  os.mkdir(reports_path)
-  bar = Bar('Client Reports Created', max=len(clients))
-  for client in clients:
-    print('\n')
-    log.info("Generating report for %s", client)
-    stocks = clients[client]
-    report_maker.create_report(stocks, output_dir, client, profiles, news, quotes, sentiment_scores)
-    bar.next()
-  bar.finish()
 
+def __finish(path, results) -> None:
+  # the reports and the manifest of the sent emails are kept until every email is sent
+  failed = pipeline.failed_emails(results)
+  if failed:
+    log.warning("%d reports could not be emailed. Keeping temporary directory %s so a run with --resume sends them",
+                len(failed), path)
+    return
+  __cleanup(path)
+  
 
-def __email_reports(reports_dir, clients, sender) -> None:
-  bar = Bar('Emailing Reports', max=len(clients))
-  for client in clients:
-    gmail_api.email_report(sender, client, reports_dir)
-    bar.next()
-  bar.finish()
+def __shard_name(stage, index, shards) -> str:
+  return "%s-%d-of-%d" % (stage, index, shards)
+
+
+def __launch_stock_shards(args) -> None:
+  """
+  Runs the sections stage of every stock shard in its own process and waits for all of them
+  """
+  procs = []
+  for i in range(args.shards):
+    cmd = [sys.executable, os.path.abspath(__file__), args.stockconfig, '--stage', 'sections',
+           '--shards', str(args.shards), '--shard-index', str(i), '--charts', args.charts, '--sentiment', args.sentiment,
+           '--news', args.news]
+    if args.dedupe:
+      cmd.append('--dedupe')
+    if args.loglevel:
+      cmd += ['--loglevel', args.loglevel]
+    if args.test:
+      cmd.append('--test')
+    if args.resume:
+      cmd.append('--resume')
+    procs.append(subprocess.Popen(cmd))
+  failed = [i for i, proc in enumerate(procs) if proc.wait() != 0]
+  if failed:
+    raise RuntimeError("Stock shards " + ", ".join(str(i) for i in failed) + " failed")
+
+
+def __run_sharded(args, clients, sender, index) -> None:
+  """
+  Runs a stage of a sharded run, see src/sharding.py
+  """
+  shards = args.shards
+  shard = args.shard_index
+  if shards < 1 or (shard is not None and not 0 <= shard < shards):
+    raise ValueError("Invalid shard index " + str(shard) + " of " + str(shards) + " shards")
+  if args.stage == "sections":
+    if shard is None:
+      raise ValueError("--shard-index is required to render the sections of a stock shard")
+    name = __shard_name("sections", shard, shards)
+    temp_dir = __setup(args.resume, name)
+    stocks = sharding.partition_stocks(clients, shards, shard)
+    log.info("Rendering sections of %d stocks for shard %d of %d", len(stocks), shard, shards)
+    with metrics.stage("sections"):
+      results = pipeline.run({}, temp_dir, args.charts, None, args.resume, stocks=stocks, journal_name=name)
+    sharding.save_sections({task[1]: r for task, r in results.items() if task[0] == "section"}, shards, shard)
+  else:
+    if args.stage == "all":
+      with metrics.stage("stock_shards"):
+        __launch_stock_shards(args)
+    if shard is not None:
+      clients = sharding.partition_clients(clients, shards, shard)
+    name = __shard_name("merge", shard, shards) if shard is not None else None
+    temp_dir = __setup(args.resume, name)
+    log.info("Writing reports of %d clients from %d stock shards", len(clients), shards)
+    state = config_index.load_state(args.stockconfig, index, name) if args.delta else None
+    with metrics.stage("merge"):
+      results = pipeline.run(clients, temp_dir, args.charts, None if args.test else sender, args.resume,
+                   sections=sharding.load_sections(shards), journal_name=name or "merge", state=state)
+  if not args.test:
+    __finish(temp_dir, results)
+
+
+def __write_metrics(name) -> None:
+  for endpoint, stats in response_cache.stats().items():
+    metrics.set_gauge("cache_hits", stats["hits"], endpoint=endpoint)
+    metrics.set_gauge("cache_misses", stats["misses"], endpoint=endpoint)
+    if stats["hits"] + stats["misses"] > 0:
+      metrics.set_gauge("cache_hit_ratio", stats["hits"] / (stats["hits"] + stats["misses"]), endpoint=endpoint)
+  metrics.save_profiles()
+  metrics.write(settings.METRICS_DIR, name)
 
 
 def main():
@@ -60,6 +126,28 @@ def main():
   parser.add_argument('stockconfig', help='yaml file with email to stock symbol list mapping')
   parser.add_argument('--test', action='store_true', help='Run in test mode where tmp directory will not be removed.') 
   parser.add_argument('--loglevel', help='set logging level [INFO, DEBUG, WARN]. default is INFO')
+  parser.add_argument('--resume', action='store_true',
+    help='skip the fetches, charts, reports and emails already finished by an earlier run today')
+  parser.add_argument('--shards', type=int, default=1,
+    help='number of shards the stocks and clients are split into. default is 1')
+  parser.add_argument('--shard-index', type=int,
+    help='shard to run, from 0 to shards - 1. the sections stage renders this stock shard, the merge stage reports this client shard')
+  parser.add_argument('--stage', choices=['all', 'sections', 'merge'], default='all',
+    help='sections renders a stock shard, merge writes and emails reports from the sections of every stock shard. '
+         'all runs every stock shard in its own process and then merges. default is all')
+  parser.add_argument('--delta', action='store_true',
+    help='only write and email the reports whose stocks or stock data changed since they were last emailed')
+  parser.add_argument('--profile', action='store_true',
+    help='write cProfile and tracemalloc output of every stage next to the run metrics')
+  parser.add_argument('--charts', choices=['png', 'svg'], default='png',
+    help='png charts are uploaded to the GCP bucket, svg charts are embedded in the reports. default is png')
+  parser.add_argument('--sentiment', choices=['textblob', 'fast'], default=settings.SENTIMENT_BACKEND,
+    help='sentiment backend, fast uses a compiled lexicon port of the textblob analyzer. default is textblob')
+  parser.add_argument('--news', choices=['full', 'stream'], default=settings.NEWS_INGESTION,
+    help='stream parses company news as it downloads, keeping only the most recent articles shown in the reports '
+         'and a running sentiment aggregate. default is full')
+  parser.add_argument('--dedupe', action='store_true', default=settings.NEWS_DEDUPE,
+    help='list near-duplicate news published for several stocks once, as the earliest copy, and score it once')
 
   args = parser.parse_args()
   config = args.stockconfig
@@ -72,43 +160,49 @@ def main():
     loglevel = log.WARN
   
   log.getLogger().setLevel(loglevel)
-  log.info("Running using args: [ Config File: %s, Test Mode: %s, Log Level: %s ]", 
-    config, str(testMode), str(loglevel))
+  settings.SENTIMENT_BACKEND = args.sentiment
+  settings.NEWS_INGESTION = args.news
+  settings.NEWS_DEDUPE = args.dedupe
+  if args.dedupe and args.news == "stream":
+    log.warning("News deduplication needs the full news of every stock and is skipped when news is streamed")
+  log.info("Running using args: [ Config File: %s, Test Mode: %s, Log Level: %s, Charts: %s, Sentiment: %s, News: %s, Dedupe: %s, Resume: %s, Delta: %s, Shards: %d, Stage: %s ]", 
+    config, str(testMode), str(loglevel), args.charts, args.sentiment, args.news, str(args.dedupe), str(args.resume), str(args.delta), args.shards, args.stage)
 
   if testMode: 
     log.info("Test mode is enabled. Temporary directory will not be removed.")
 
-  temp_dir = __setup()
-
-  log.info("Parsing config file %s", config)
-  with io.open(config, 'r') as stream:
-    data = yaml.safe_load(stream)
-
-  stocks = set()
-  clients = {}
-  people = data["mappings"]
-  sender = data["sender"]
-  for p in people:
-    clients[p["email"]] = p["stocks"]
-    stocks.update(p["stocks"])
-
-  log.info("Identified the following clients: " + ','.join(clients.keys()))
-  log.info("Getting information on the following stocks: " + ','.join(stocks))
-
-  profiles = util_functions.get_company_profiles(stocks)
-  news = util_functions.get_company_news(stocks)
-  quotes = util_functions.get_stock_quotes(stocks)
-  #industry_news = util_functions.get_industry_news(profiles)
-  util_functions.create_historical_price_charts(stocks, temp_dir)
-  sentiment_scores = util_functions.get_sentiment_scores(news)
-  
-  __generate_reports(temp_dir, clients, profiles, news, quotes, sentiment_scores)
-
-  if not testMode:
-    __email_reports(os.path.join(temp_dir,"reports"), clients, sender)
-    __cleanup(temp_dir)
-
+  run_name = datetime.now().strftime("run-%Y%m%d-%H%M%S")
+  if args.stage != "all":
+    run_name += "-" + args.stage + ("" if args.shard_index is None else "-" + __shard_name("shard", args.shard_index, args.shards))
+  if args.profile:
+    metrics.enable_profiling(os.path.join(settings.METRICS_DIR, run_name + "-profile"))
+
+  try:
+    with metrics.stage("config"):
+      log.info("Loading config file %s", config)
+      index = config_index.load(config)
+      clients = index.clients
+      stocks = index.stocks()
+      sender = index.sender
+
+    log.info("Identified the following clients: " + ','.join(clients.keys()))
+    log.info("Getting information on the following stocks: " + ','.join(stocks))
+
+    if args.shards > 1 or args.stage != "all":
+      __run_sharded(args, clients, sender, index)
+    else:
+      temp_dir = __setup(args.resume)
+      state = config_index.load_state(config, index) if args.delta else None
+      # stocks flow through fetching, sentiment, charts, reports and email independently of each other
+      with metrics.stage("pipeline"):
+        results = pipeline.run(clients, temp_dir, args.charts, None if testMode else sender, args.resume, state=state)
+      if not testMode:
+        __finish(temp_dir, results)
+  finally:
+    log.info("Response cache hits and misses: %s", response_cache.stats())
+    __write_metrics(run_name)
   log.info("DONE.")
 
 
-main()
+if __name__ == "__main__":
+  main()
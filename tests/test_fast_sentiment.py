@@ -0,0 +1,10 @@
+from src.sentiment import fast_sentiment
+
+
+def test_matches_textblob_on_the_parity_corpus():
+  assert fast_sentiment.check_parity() == []
+
+
+def test_bulk_scores_match_single_scores():
+  texts = fast_sentiment.PARITY_CORPUS
+  assert fast_sentiment.get_sentiments(texts) == [fast_sentiment.get_sentiment(t) for t in texts]
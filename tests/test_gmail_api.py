@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from src import settings
+from src.api import gmail_api
+from src.api import rate_limiter
+
+
+@pytest.fixture
+def service(monkeypatch):
+  """
+  Returns a function that makes send_messages use a fresh FakeService with the given failure rate, without waiting
+  for the gmail rate limits or backoff
+  """
+  monkeypatch.setattr(rate_limiter, "acquire", lambda provider: None)
+  monkeypatch.setattr(rate_limiter, "pause", lambda provider, seconds: None)
+  monkeypatch.setattr(rate_limiter, "get_backoff", lambda attempt, retry_after=None: 0)
+  monkeypatch.setattr(settings, "GMAIL_BATCH_SIZE", 7)
+  random.seed(0)
+
+  def make(failure_rate, max_retries):
+    monkeypatch.setattr(settings, "MAX_RETRIES", max_retries)
+    fake = gmail_api.FakeService(failure_rate=failure_rate)
+    monkeypatch.setattr(gmail_api, "get_service", lambda: fake)
+    return fake
+  return make
+
+
+def messages(n):
+  return {"client%d@example.com" % i: {"raw": "message %d" % i} for i in range(n)}
+
+
+def test_retries_until_every_message_is_delivered(service):
+  fake = service(failure_rate=0.5, max_retries=30)
+  batches = []
+  sent = gmail_api.send_messages("sender@example.com", messages(40), batches.append)
+
+  assert sorted(sent) == sorted(messages(40))
+  assert all(message_id is not None for message_id in sent.values())
+  # every message is delivered exactly once, with the id it was reported with
+  assert sorted(message_id for message_id, _, _ in fake.sent) == sorted(sent.values())
+  assert sorted(body["raw"] for _, _, body in fake.sent) == sorted(m["raw"] for m in messages(40).values())
+  assert {c: m for batch in batches for c, m in batch.items()} == sent
+
+
+def test_messages_that_never_succeed_are_none(service):
+  fake = service(failure_rate=1.0, max_retries=2)
+  batches = []
+  sent = gmail_api.send_messages("sender@example.com", messages(10), batches.append)
+
+  assert sent == {client: None for client in messages(10)}
+  assert fake.sent == []
+  assert batches == []
+
+
+def test_partial_failure_without_retries(service):
+  fake = service(failure_rate=0.5, max_retries=0)
+  sent = gmail_api.send_messages("sender@example.com", messages(40))
+
+  delivered = {c: m for c, m in sent.items() if m is not None}
+  assert sorted(sent) == sorted(messages(40))
+  assert 0 < len(delivered) < 40
+  assert sorted(message_id for message_id, _, _ in fake.sent) == sorted(delivered.values())
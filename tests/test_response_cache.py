@@ -0,0 +1,32 @@
+import pytest
+
+from src import settings
+from src.api import response_cache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+  """
+  Points the response cache at an empty database of the test
+  """
+  monkeypatch.setattr(settings, "CACHE_PATH", str(tmp_path / "responses.sqlite"))
+  monkeypatch.setattr(settings, "CACHE_ENABLED", True)
+  monkeypatch.setitem(vars(response_cache), "__conn", None)
+  monkeypatch.setitem(vars(response_cache), "__total_size", None)
+  yield response_cache
+  vars(response_cache)["__conn"].close()
+
+
+def stored_size(cache) -> int:
+  return vars(cache)["__conn"].execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+
+def test_replaced_entries_are_not_counted_twice(cache):
+  for i in range(20):
+    cache.put("quote", "AAPL", {"c": i})
+    cache.put_many("sentiment", {"text%d" % j: i for j in range(5)})
+
+  assert vars(cache)["__total_size"] == stored_size(cache)
+  assert cache.get("quote", "AAPL") == {"c": 19}
+  assert cache.get_many("sentiment", ["text0", "text4"]) == {"text0": 19, "text4": 19}
+